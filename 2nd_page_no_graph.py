@@ -6,14 +6,15 @@ import dash_bootstrap_components as dbc
 import matplotlib as mpl
 from mplsoccer import Pitch, VerticalPitch, FontManager
 import matplotlib.patheffects as path_effects
-import pandas as pd
 from matplotlib.colors import LinearSegmentedColormap
 from scipy.ndimage import gaussian_filter
 import matplotlib.pyplot as plt
 import io
 import base64
 
-df = pd.read_csv('../my_proj/all_shots_16_20.csv')
+from dataset import load_shots
+
+df = load_shots()
 
 # Fonts
 robotto_regular = FontManager()
@@ -6,6 +6,7 @@ Created on Wed Mar 25 17:32:00 2020
 @author: davsu428
 """
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from matplotlib.patches import Arc
 
 def createPitch(length,width, unity,linecolor): # in meters
@@ -16,6 +17,9 @@ def createPitch(length,width, unity,linecolor): # in meters
     And 'width' is the width of the pitch (sideline to sideline). 
     Fill in the unity in meters or in yards.
 
+    The pitch is drawn on every call, its lines as one collection. Unlike the
+    mplsoccer pitches of rendering.py it is not kept as a template: pasting a
+    cached image of it costs matplotlib more than drawing these few lines.
     """
     #Set unity
     if unity == "meters":
@@ -30,32 +34,37 @@ def createPitch(length,width, unity,linecolor): # in meters
             #fig.set_size_inches(7, 5)
             ax=fig.add_subplot(1,1,1)
            
-            #Pitch Outline & Centre Line
-            plt.plot([0,0],[0,width], color=linecolor)
-            plt.plot([0,length],[width,width], color=linecolor)
-            plt.plot([length,length],[width,0], color=linecolor)
-            plt.plot([length,0],[0,0], color=linecolor)
-            plt.plot([length/2,length/2],[0,width], color=linecolor)
-            
-            #Left Penalty Area
-            plt.plot([16.5 ,16.5],[(width/2 +16.5),(width/2-16.5)],color=linecolor)
-            plt.plot([0,16.5],[(width/2 +16.5),(width/2 +16.5)],color=linecolor)
-            plt.plot([16.5,0],[(width/2 -16.5),(width/2 -16.5)],color=linecolor)
-            
-            #Right Penalty Area
-            plt.plot([(length-16.5),length],[(width/2 +16.5),(width/2 +16.5)],color=linecolor)
-            plt.plot([(length-16.5), (length-16.5)],[(width/2 +16.5),(width/2-16.5)],color=linecolor)
-            plt.plot([(length-16.5),length],[(width/2 -16.5),(width/2 -16.5)],color=linecolor)
-            
-            #Left 5-meters Box
-            plt.plot([0,5.5],[(width/2+7.32/2+5.5),(width/2+7.32/2+5.5)],color=linecolor)
-            plt.plot([5.5,5.5],[(width/2+7.32/2+5.5),(width/2-7.32/2-5.5)],color=linecolor)
-            plt.plot([5.5,0.5],[(width/2-7.32/2-5.5),(width/2-7.32/2-5.5)],color=linecolor)
-            
-            #Right 5 -eters Box
-            plt.plot([length,length-5.5],[(width/2+7.32/2+5.5),(width/2+7.32/2+5.5)],color=linecolor)
-            plt.plot([length-5.5,length-5.5],[(width/2+7.32/2+5.5),width/2-7.32/2-5.5],color=linecolor)
-            plt.plot([length-5.5,length],[width/2-7.32/2-5.5,width/2-7.32/2-5.5],color=linecolor)
+            #Pitch lines as (xs, ys) pairs, drawn together as one collection
+            lines = [
+                #Pitch Outline & Centre Line
+                ([0,0],[0,width]),
+                ([0,length],[width,width]),
+                ([length,length],[width,0]),
+                ([length,0],[0,0]),
+                ([length/2,length/2],[0,width]),
+
+                #Left Penalty Area
+                ([16.5 ,16.5],[(width/2 +16.5),(width/2-16.5)]),
+                ([0,16.5],[(width/2 +16.5),(width/2 +16.5)]),
+                ([16.5,0],[(width/2 -16.5),(width/2 -16.5)]),
+
+                #Right Penalty Area
+                ([(length-16.5),length],[(width/2 +16.5),(width/2 +16.5)]),
+                ([(length-16.5), (length-16.5)],[(width/2 +16.5),(width/2-16.5)]),
+                ([(length-16.5),length],[(width/2 -16.5),(width/2 -16.5)]),
+
+                #Left 5-meters Box
+                ([0,5.5],[(width/2+7.32/2+5.5),(width/2+7.32/2+5.5)]),
+                ([5.5,5.5],[(width/2+7.32/2+5.5),(width/2-7.32/2-5.5)]),
+                ([5.5,0.5],[(width/2-7.32/2-5.5),(width/2-7.32/2-5.5)]),
+
+                #Right 5 -eters Box
+                ([length,length-5.5],[(width/2+7.32/2+5.5),(width/2+7.32/2+5.5)]),
+                ([length-5.5,length-5.5],[(width/2+7.32/2+5.5),width/2-7.32/2-5.5]),
+                ([length-5.5,length],[width/2-7.32/2-5.5,width/2-7.32/2-5.5]),
+            ]
+            ax.add_collection(LineCollection([list(zip(xs, ys)) for xs, ys in lines], colors=linecolor))
+            ax.autoscale_view()
             
             #Prepare Circles
             centreCircle = plt.Circle((length/2,width/2),9.15,color=linecolor,fill=False)
@@ -92,32 +101,37 @@ def createPitch(length,width, unity,linecolor): # in meters
             #fig.set_size_inches(7, 5)
             ax=fig.add_subplot(1,1,1)
            
-            #Pitch Outline & Centre Line
-            plt.plot([0,0],[0,width], color=linecolor)
-            plt.plot([0,length],[width,width], color=linecolor)
-            plt.plot([length,length],[width,0], color=linecolor)
-            plt.plot([length,0],[0,0], color=linecolor)
-            plt.plot([length/2,length/2],[0,width], color=linecolor)
-            
-            #Left Penalty Area
-            plt.plot([18 ,18],[(width/2 +18),(width/2-18)],color=linecolor)
-            plt.plot([0,18],[(width/2 +18),(width/2 +18)],color=linecolor)
-            plt.plot([18,0],[(width/2 -18),(width/2 -18)],color=linecolor)
-            
-            #Right Penalty Area
-            plt.plot([(length-18),length],[(width/2 +18),(width/2 +18)],color=linecolor)
-            plt.plot([(length-18), (length-18)],[(width/2 +18),(width/2-18)],color=linecolor)
-            plt.plot([(length-18),length],[(width/2 -18),(width/2 -18)],color=linecolor)
-            
-            #Left 6-yard Box
-            plt.plot([0,6],[(width/2+7.32/2+6),(width/2+7.32/2+6)],color=linecolor)
-            plt.plot([6,6],[(width/2+7.32/2+6),(width/2-7.32/2-6)],color=linecolor)
-            plt.plot([6,0],[(width/2-7.32/2-6),(width/2-7.32/2-6)],color=linecolor)
-            
-            #Right 6-yard Box
-            plt.plot([length,length-6],[(width/2+7.32/2+6),(width/2+7.32/2+6)],color=linecolor)
-            plt.plot([length-6,length-6],[(width/2+7.32/2+6),width/2-7.32/2-6],color=linecolor)
-            plt.plot([length-6,length],[(width/2-7.32/2-6),width/2-7.32/2-6],color=linecolor)
+            #Pitch lines as (xs, ys) pairs, drawn together as one collection
+            lines = [
+                #Pitch Outline & Centre Line
+                ([0,0],[0,width]),
+                ([0,length],[width,width]),
+                ([length,length],[width,0]),
+                ([length,0],[0,0]),
+                ([length/2,length/2],[0,width]),
+
+                #Left Penalty Area
+                ([18 ,18],[(width/2 +18),(width/2-18)]),
+                ([0,18],[(width/2 +18),(width/2 +18)]),
+                ([18,0],[(width/2 -18),(width/2 -18)]),
+
+                #Right Penalty Area
+                ([(length-18),length],[(width/2 +18),(width/2 +18)]),
+                ([(length-18), (length-18)],[(width/2 +18),(width/2-18)]),
+                ([(length-18),length],[(width/2 -18),(width/2 -18)]),
+
+                #Left 6-yard Box
+                ([0,6],[(width/2+7.32/2+6),(width/2+7.32/2+6)]),
+                ([6,6],[(width/2+7.32/2+6),(width/2-7.32/2-6)]),
+                ([6,0],[(width/2-7.32/2-6),(width/2-7.32/2-6)]),
+
+                #Right 6-yard Box
+                ([length,length-6],[(width/2+7.32/2+6),(width/2+7.32/2+6)]),
+                ([length-6,length-6],[(width/2+7.32/2+6),width/2-7.32/2-6]),
+                ([length-6,length],[(width/2-7.32/2-6),width/2-7.32/2-6]),
+            ]
+            ax.add_collection(LineCollection([list(zip(xs, ys)) for xs, ys in lines], colors=linecolor))
+            ax.autoscale_view()
             
             #Prepare Circles; 10 yards distance. penalty on 12 yards
             centreCircle = plt.Circle((length/2,width/2),10,color=linecolor,fill=False)
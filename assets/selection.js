@@ -0,0 +1,34 @@
+// the dropdown filter of the clientside callbacks (shot_map.js, summary_cards.js), loaded before them
+(function () {
+    var COLUMNS = ['competition_name', 'season_name', 'team_name', 'player_name'];
+
+    function allowed(categories, values) {
+        // null when the dropdown is empty, i.e. no filter on that column
+        if (values === null || values === undefined || values === '' || values.length === 0) {
+            return null;
+        }
+        var wanted = new Set();
+        [].concat(values).forEach(function (value) {
+            wanted.add(categories.indexOf(value));
+        });
+        return wanted;
+    }
+
+    function filters(categories, codes, values) {
+        // [codes of the rows, allowed codes] of the dropdowns (competitions, seasons, team, player) that filter
+        return COLUMNS.map(function (column, i) {
+            return [codes[column], allowed(categories[column], values[i])];
+        }).filter(function (f) { return f[1] !== null; });
+    }
+
+    function matches(filters, row) {
+        for (var f = 0; f < filters.length; f++) {
+            if (!filters[f][1].has(filters[f][0][row])) {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    window.shot_selection = {filters: filters, matches: matches};
+})();
@@ -0,0 +1,103 @@
+// xG shot map drawn in the browser (SHOT_MAP_MODE=client), fed by client_data.py
+(function () {
+    // marker diameter in px per sqrt(points^2) of the matplotlib sizes, for a graph ~500px wide
+    var SIZE_SCALE = 0.6;
+    var decoded = new WeakMap();
+
+    function unpack(b64, Type) {
+        var binary = atob(b64);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new Type(bytes.buffer);
+    }
+
+    function columns(shots) {
+        // decoded once per payload, every dropdown change reuses the arrays
+        var cols = decoded.get(shots);
+        if (!cols) {
+            cols = {
+                X: unpack(shots.X, Float32Array),
+                Y: unpack(shots.Y, Float32Array),
+                my_xg: unpack(shots.my_xg, Float32Array),
+                Goal: unpack(shots.Goal, Uint8Array),
+                codes: {}
+            };
+            Object.keys(shots.codes).forEach(function (column) {
+                cols.codes[column] = unpack(shots.codes[column], Int32Array);
+            });
+            decoded.set(shots, cols);
+        }
+        return cols;
+    }
+
+    function trace(points, cols, shots, marker) {
+        var n = points.length;
+        var x = new Float32Array(n), y = new Float32Array(n), size = new Float32Array(n), text = new Array(n);
+        var players = shots.categories.player_name;
+        for (var i = 0; i < n; i++) {
+            var row = points[i];
+            var xg = cols.my_xg[row];
+            // vertical pitch: the pitch x runs up the image
+            x[i] = cols.Y[row];
+            y[i] = cols.X[row];
+            size[i] = Math.sqrt(xg * 1900 + 100) * SIZE_SCALE;
+            text[i] = players[cols.codes.player_name[row]] + '<br>xG ' + xg.toFixed(2);
+        }
+        return {
+            type: 'scattergl', mode: 'markers', x: x, y: y, text: text,
+            hovertemplate: '%{text}<extra></extra>',
+            marker: Object.assign({size: size}, marker)
+        };
+    }
+
+    function figure(competitions, seasons, team, player, shots, pitch) {
+        if (!shots || !pitch) {
+            return window.dash_clientside.no_update;
+        }
+        var cols = columns(shots);
+        var filters = window.shot_selection.filters(shots.categories, cols.codes,
+                                                    [competitions, seasons, team, player]);
+
+        var goals = [], misses = [];
+        for (var row = 0; row < shots.length; row++) {
+            if (window.shot_selection.matches(filters, row)) {
+                (cols.Goal[row] ? goals : misses).push(row);
+            }
+        }
+
+        var title = 'XGoal Analysis';
+        if (player) {
+            title = player + '<br>' + competitions[0];
+        } else if (competitions && competitions.length) {
+            title = competitions[0];
+        }
+
+        var x = pitch.x_range, y = pitch.y_range;
+        return {
+            data: [
+                trace(misses, cols, shots, {color: 'rgba(0,0,0,0)', line: {color: '#b94b75', width: 1.5}}),
+                trace(goals, cols, shots, {color: 'white', line: {color: 'blue', width: 1}})
+            ],
+            layout: {
+                xaxis: {range: x, visible: false, fixedrange: true},
+                yaxis: {range: y, visible: false, fixedrange: true, scaleanchor: 'x'},
+                images: [{
+                    source: pitch.image, xref: 'x', yref: 'y', layer: 'below', sizing: 'stretch',
+                    x: Math.min(x[0], x[1]), y: Math.max(y[0], y[1]),
+                    sizex: Math.abs(x[1] - x[0]), sizey: Math.abs(y[1] - y[0])
+                }],
+                annotations: [{x: 40, y: 80, text: title, showarrow: false, font: {size: 18, color: 'white'}}],
+                margin: {l: 0, r: 0, t: 0, b: 0},
+                showlegend: false,
+                paper_bgcolor: 'rgba(0,0,0,0)',
+                plot_bgcolor: 'rgba(0,0,0,0)'
+            }
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        shot_map: {figure: figure}
+    });
+})();
@@ -0,0 +1,70 @@
+// shot / goal / goal percentage cards computed in the browser (SUMMARY_CARDS=client), fed by client_data.py
+(function () {
+    function sum(totals, competitions, seasons, team, player) {
+        // the cells hold the codes of their names in the columns of the same name
+        var filters = window.shot_selection.filters(totals.categories, totals,
+                                                    [competitions, seasons, team, player]);
+        var shots = 0, goals = 0;
+        for (var cell = 0; cell < totals.shots.length; cell++) {
+            if (window.shot_selection.matches(filters, cell)) {
+                shots += totals.shots[cell];
+                goals += totals.goals[cell];
+            }
+        }
+        return {shots: shots, goals: goals};
+    }
+
+    function card(title, value, color, style) {
+        // same markup as the server side dbc.Card of main.py
+        return {
+            namespace: 'dash_bootstrap_components', type: 'Card',
+            props: {
+                color: color, inverse: true, style: style,
+                children: {
+                    namespace: 'dash_bootstrap_components', type: 'CardBody',
+                    props: {
+                        children: [
+                            {namespace: 'dash_html_components', type: 'H5',
+                             props: {children: title, className: 'card-title'}},
+                            {namespace: 'dash_html_components', type: 'H3',
+                             props: {children: value, className: 'card-text'}}
+                        ]
+                    }
+                }
+            }
+        };
+    }
+
+    function percent(goals, shots) {
+        // formatted like python's str(round(x, 2))
+        var value = Math.round((goals / shots) * 100 * 100) / 100;
+        return (Number.isInteger(value) ? value.toFixed(1) : String(value)) + ' %';
+    }
+
+    function cards(competitions, seasons, team, player, totals) {
+        if (!totals) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update,
+                    window.dash_clientside.no_update];
+        }
+        var result = sum(totals, competitions, seasons, team, player);
+        return [
+            card('Number of Shoots:', String(result.shots), 'warning', {width: '18rem'}),
+            card('Number of Goals:', String(result.goals), 'success', {width: '18rem', 'margin-top': '5px'}),
+            // no shots: the server callback fails and leaves the card as it was
+            result.shots ? card('Average goal percentage:', percent(result.goals, result.shots), 'primary',
+                                {width: '18rem', 'margin-top': '5px'})
+                         : window.dash_clientside.no_update
+        ];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        summary_cards: {
+            player: function (competitions, seasons, team, player, totals) {
+                return cards(competitions, seasons, team, player, totals);
+            },
+            league: function (competitions, seasons, totals) {
+                return cards(competitions, seasons, null, null, totals);
+            }
+        }
+    });
+})();
@@ -0,0 +1,261 @@
+"""
+Latency and memory benchmark of the main.py callbacks.
+
+The shot table is scaled synthetically (1x, 10x, 100x all_shots_16_20.csv by
+default): every copy of the table gets its own match ids, and the shot
+locations are jittered a little. For every scale a fresh process imports the
+app on that table and calls each server callback driven by the dropdowns
+(the cards, the options, the top scorers, the xG map and the heat map)
+directly, for a matrix of selections: one league, one league and season,
+all leagues, one player and a selection without shots.
+
+Every call is timed `repeats` times cold (the in-memory caches emptied
+first) and warm (straight after the cold calls). The results are the outcome of the
+calls (ok, prevented or the exception raised), p50 / p95 / mean latency, the peak RSS of the process, and the bytes allocated by a
+cold call as traced by tracemalloc in a separate pass, so the tracing does
+not slow down the timed calls. They are written as JSON. `--compare` checks
+the run against an earlier result file and exits with status 1 when a p95
+got slower than `--tolerance` times its baseline:
+
+    python benchmark.py --out bench.json
+    python benchmark.py --scales 1 10 --out new.json --compare bench.json
+    python benchmark.py --only shoot_heatmap table_top_scorers --repeats 20
+
+At 100x a cold xG map takes minutes to draw, so a full run is long.
+
+The figures are drawn in the benchmark process (RENDER_WORKERS=0) unless
+RENDER_WORKERS is set, so render time shows up in the callback latency.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from caching import SizedLRUCache
+from dataset import SHOTS_PATH, columnar_path, feather, load_shots
+
+DROPDOWNS = ['competition_select', 'season_select', 'team_select', 'player_select']
+VIEWPORT = {'width': 1920, 'ratio': 1}
+
+
+def scaled_dataset(factor, directory, source=SHOTS_PATH, seed=0):
+    """Write the shot table repeated `factor` times under `directory`; returns the path to point SHOTS_PATH at."""
+    csv_path = os.path.join(directory, 'shots_{}x.csv'.format(factor))
+    path = columnar_path(csv_path) if feather is not None else csv_path
+    if os.path.exists(path):
+        return csv_path
+    df = load_shots(source)
+    rng = np.random.default_rng(seed)
+    offset = int(df['match_id'].max()) + 1
+    copies = []
+    for i in range(factor):
+        copy = df.copy()
+        if i:
+            copy['match_id'] += i * offset
+            for column, limit in (('X', 120), ('Y', 80)):
+                jitter = rng.uniform(-0.5, 0.5, len(copy)).astype('float32')
+                copy[column] = (copy[column] + jitter).clip(0, limit)
+        copies.append(copy)
+    scaled = pd.concat(copies, ignore_index=True)
+    if feather is not None:
+        # the columnar copy is what load_shots reads when there is no newer CSV next to it
+        feather.write_feather(scaled, path, compression='uncompressed')
+    else:
+        scaled.to_csv(csv_path, index=False)
+    return csv_path
+
+
+def selections(shots):
+    """{name: {dropdown id: value}} of the selection matrix, picked from the data."""
+    df = shots.select(columns=['competition_name', 'season_name', 'team_name', 'player_name'])
+    competition = df['competition_name'].value_counts().index[0]
+    season = df.loc[df['competition_name'] == competition, 'season_name'].value_counts().index[0]
+    league = df[df['competition_name'] == competition]
+    team, player = league.groupby(['team_name', 'player_name'], observed=True).size().idxmax()
+    # a competition and a season it has no shots in, as picked in the dropdowns, else a player without shots
+    present = set(shots.partitions())
+    missing = [(c, s) for c in shots.competitions() for s in shots.seasons() if (c, s) not in present]
+    empty = ({'competition_select': [missing[0][0]], 'season_select': [missing[0][1]]} if missing
+             else {'competition_select': [competition], 'player_select': 'No Such Player'})
+    return {
+        'single_league': {'competition_select': [competition]},
+        'single_league_season': {'competition_select': [competition], 'season_select': [season]},
+        'all_leagues': {'competition_select': shots.competitions()},
+        'single_player': {'competition_select': [competition], 'team_select': team, 'player_select': player},
+        'empty': empty,
+    }
+
+
+def _unwrap(function):
+    while hasattr(function, '__wrapped__'):
+        function = function.__wrapped__
+    return function
+
+
+def dropdown_callbacks(app):
+    """{name: (function, input ids)} of the server callbacks that only take the dropdowns (and the viewport)."""
+    callbacks = {}
+    for output, spec in app.callback_map.items():
+        if 'callback' not in spec:
+            continue
+        ids = [i['id'] for i in spec['inputs']]
+        if ids and all(i in DROPDOWNS + ['viewport'] for i in ids):
+            callbacks[output] = (_unwrap(spec['callback']), ids)
+    return callbacks
+
+
+def clear_caches(main):
+    """Empty the in-memory caches main.py answers from, images and shot source alike."""
+    shots = _unwrap(main.shots)  # the metrics proxy of main.py
+    owners = [main.images, shots] + list(vars(shots).values())
+    for owner in owners:
+        for value in getattr(owner, '__dict__', {}).values():
+            if isinstance(value, SizedLRUCache):
+                value.clear()
+
+
+def _call(function, ids, selection):
+    """Outcome of the call: 'ok', 'prevented' (PreventUpdate) or the name of the exception it raised."""
+    from dash.exceptions import PreventUpdate
+    args = [VIEWPORT if i == 'viewport' else selection.get(i) for i in ids]
+    try:
+        function(*args)
+    except PreventUpdate:
+        return 'prevented'
+    except Exception as e:
+        # still timed: a callback failing on some selection is a finding, not a reason to stop the run
+        return type(e).__name__
+    return 'ok'
+
+
+def _stats(samples):
+    ms = np.array(samples) * 1000
+    return {'n': len(ms), 'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95)),
+            'mean_ms': float(ms.mean())}
+
+
+def run_scale(repeats, only=()):
+    """Benchmark the app of the current process environment; the body of a scale's subprocess."""
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+    rss_after_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    callbacks = {name: callback for name, callback in dropdown_callbacks(main.app).items()
+                 if not only or any(part in name for part in only)}
+    matrix = selections(main.shots)
+    results = {}
+    for name, (function, ids) in sorted(callbacks.items()):
+        for selection_name, selection in matrix.items():
+            cold, warm, outcomes = [], [], set()
+            for _ in range(repeats):
+                clear_caches(main)
+                t = time.perf_counter()
+                outcomes.add(_call(function, ids, selection))
+                cold.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                outcomes.add(_call(function, ids, selection))
+                warm.append(time.perf_counter() - t)
+            results.setdefault(name, {})[selection_name] = {'cold': _stats(cold), 'warm': _stats(warm),
+                                                            'outcome': ', '.join(sorted(outcomes))}
+    # allocations in a pass of their own, tracemalloc slows every allocation down
+    tracemalloc.start()
+    for name, (function, ids) in sorted(callbacks.items()):
+        for selection_name, selection in matrix.items():
+            clear_caches(main)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            _call(function, ids, selection)
+            current, peak = tracemalloc.get_traced_memory()
+            results[name][selection_name]['alloc_peak_bytes'] = peak - before
+            results[name][selection_name]['alloc_net_bytes'] = current - before
+    tracemalloc.stop()
+    return {'shots': int(len(main.shots.select(columns=['X']))),
+            'import_seconds': import_seconds,
+            'rss_after_import_bytes': rss_after_import,
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'selections': matrix,
+            'callbacks': results}
+
+
+def compare(result, baseline, tolerance):
+    """Lines describing every p95 of `result` slower than `tolerance` times the same one of `baseline`."""
+    regressions = []
+    for scale, run in result['scales'].items():
+        old_run = baseline.get('scales', {}).get(scale, {})
+        for name, by_selection in run['callbacks'].items():
+            for selection, modes in by_selection.items():
+                for mode in ('cold', 'warm'):
+                    try:
+                        old = old_run['callbacks'][name][selection][mode]['p95_ms']
+                    except KeyError:
+                        continue
+                    new = modes[mode]['p95_ms']
+                    # sub-millisecond timings are mostly noise
+                    if new > max(old * tolerance, old + 1):
+                        regressions.append('{}x {} {} {}: p95 {:.1f} ms, was {:.1f} ms'.format(
+                            scale, name, selection, mode, new, old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', nargs='+', default=[], metavar='OUTPUT',
+                        help='benchmark just the callbacks whose output contains one of these, e.g. shooting_xg')
+    parser.add_argument('--source', default=SHOTS_PATH, help='shot table to scale')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'shot_benchmark'))
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', help='earlier result file to check the run against')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--scale-worker', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.scale_worker:
+        run = run_scale(args.repeats, args.only)
+        with open(args.scale_worker, 'w') as f:
+            json.dump(run, f)
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    result = {'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'repeats': args.repeats, 'scales': {}}
+    for factor in args.scales:
+        env = dict(os.environ, SHOTS_PATH=scaled_dataset(factor, args.data_dir, args.source))
+        env.setdefault('RENDER_WORKERS', '0')
+        # the disk image cache would turn the cold calls into disk reads
+        env.pop('IMAGE_CACHE_DIR', None)
+        scale_path = os.path.join(args.data_dir, 'result_{}x.json'.format(factor))
+        # one process per scale: a clean import of the app, and a peak RSS of that scale only
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--scale-worker', scale_path,
+                        '--repeats', str(args.repeats)] + (['--only'] + args.only if args.only else []),
+                       env=env, check=True)
+        with open(scale_path) as f:
+            run = result['scales'][str(factor)] = json.load(f)
+        print('{}x: {} shots, peak RSS {:.0f} MB'.format(factor, run['shots'], run['peak_rss_bytes'] / 2 ** 20),
+              file=sys.stderr)
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Small in-process caches shared by the dashboard.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+
+class SizedLRUCache:
+    """
+    Least recently used cache bounded by the total size of its values, as
+    reported by `sizeof`, rather than by the number of entries.
+
+    `discard` is how the owner drops what a change of its data made stale, so
+    `get_or_compute` does not keep a value when a discard ran while it was
+    computed: the value may have been computed from the data before the
+    change.
+
+    `on_evict(key)` is called, outside of the lock, for every entry that
+    makes room for another one or is too big to be kept at all.
+    """
+
+    def __init__(self, max_bytes, sizeof=sys.getsizeof, on_evict=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self.generation = 0  # number of discards and clears
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        return self._put(key, value)
+
+    def _put(self, key, value, generation=None):
+        size = self.sizeof(value)
+        evicted = []
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                # computed before a discard, from data that may have changed since
+                return value
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if size > self.max_bytes:
+                # would evict everything else and still not fit
+                evicted.append(key)
+            else:
+                self._entries[key] = (value, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted_size
+                    self.evictions += 1
+                    evicted.append(evicted_key)
+        if self.on_evict is not None:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self.generation
+            value = self._put(key, compute(), generation)
+        return value
+
+    def discard(self, predicate):
+        """Remove every entry whose key satisfies `predicate`."""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if predicate(k)]:
+                _, size = self._entries.pop(key)
+                self.current_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_MISSING = object()
@@ -0,0 +1,59 @@
+"""
+Shot data for the browser.
+
+With SHOT_MAP_MODE=client the xG page does not get a PNG per selection: the
+shots are sent once per page load, packed by `encode_shots` into base64
+little endian typed arrays, and assets/shot_map.js filters and draws them
+with Plotly over the pitch image of `pitch_layout`.
+
+With SUMMARY_CARDS=client the cells of the shot cube are shipped once per
+page load as well (`encode_totals`) and assets/summary_cards.js sums them
+for the shot, goal and goal percentage cards.
+"""
+import base64
+
+import numpy as np
+
+from image_cache import to_data_uri
+from rendering import get_template
+from shot_filter import INDEXED_COLUMNS
+
+
+def _pack(values, dtype):
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def encode_shots(df):
+    """The X / Y / my_xg / Goal columns and the dropdown columns as codes into their categories."""
+    data = {'length': len(df),
+            'X': _pack(df['X'], '<f4'),
+            'Y': _pack(df['Y'], '<f4'),
+            'my_xg': _pack(df['my_xg'], '<f4'),
+            'Goal': _pack(df['Goal'], 'u1'),
+            'codes': {},
+            'categories': {}}
+    for column in INDEXED_COLUMNS:
+        values = df[column].astype('category')
+        data['codes'][column] = _pack(values.cat.codes, '<i4')
+        data['categories'][column] = values.cat.categories.tolist()
+    return data
+
+
+def pitch_layout(style='xg_map'):
+    """Pitch image and the data ranges it covers; pitch x runs up the image, pitch y across it."""
+    image, xlim, ylim = get_template(style).axes_image()
+    return {'image': to_data_uri(image, 'image/jpeg'),
+            'x_range': [float(x) for x in xlim],
+            'y_range': [float(y) for y in ylim]}
+
+
+def encode_totals(shots):
+    """Totals of every (competition, season, team, player) as columns: category codes, shots and goals."""
+    cells = shots.cells()
+    categories = {column: sorted({key[i] for key, _ in cells}) for i, column in enumerate(INDEXED_COLUMNS)}
+    positions = {column: {value: code for code, value in enumerate(values)} for column, values in categories.items()}
+    data = {column: [positions[column][key[i]] for key, _ in cells] for i, column in enumerate(INDEXED_COLUMNS)}
+    data['shots'] = [totals.shots for _, totals in cells]
+    data['goals'] = [totals.goals for _, totals in cells]
+    data['categories'] = categories
+    return data
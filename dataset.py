@@ -0,0 +1,65 @@
+"""
+Loading of the shot table.
+
+Parsing the CSV (dates, long repeated name strings) dominates the start up of
+every worker. `convert` writes the table once, cast to the compact schema of
+schema.py, as an uncompressed Feather (Arrow IPC) file next to the CSV;
+`load_shots` picks that file up automatically when it is present and not
+older than the CSV, memory mapping it so the numeric columns are shared by
+all the worker processes reading it.
+
+    python dataset.py ../my_proj/all_shots_16_20.csv
+"""
+import os
+import sys
+
+import pandas as pd
+
+from schema import apply_schema
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional, we just keep reading the CSV
+    feather = None
+
+SHOTS_PATH = os.environ.get('SHOTS_PATH', '../my_proj/all_shots_16_20.csv')
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.feather'
+
+
+def read_csv(csv_path):
+    return apply_schema(pd.read_csv(csv_path))
+
+
+def _is_fresh(path, csv_path):
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+
+def load_shots(csv_path=SHOTS_PATH):
+    """The shot table, from its columnar copy when there is an up to date one."""
+    path = columnar_path(csv_path)
+    if feather is not None and _is_fresh(path, csv_path):
+        table = feather.read_table(path, memory_map=True)
+        # split_blocks keeps each numeric column a view on the mapped file instead of consolidating copies
+        return table.to_pandas(split_blocks=True)
+    return read_csv(csv_path)
+
+
+def convert(csv_path, path=None):
+    """Write the columnar copy of `csv_path` and return its path."""
+    if feather is None:
+        raise ImportError("pyarrow is required to write the columnar shot table")
+    path = path or columnar_path(csv_path)
+    df = read_csv(csv_path)
+    # uncompressed so the file can be memory mapped without decoding
+    feather.write_feather(df, path, compression='uncompressed')
+    return path
+
+
+if __name__ == '__main__':
+    for csv_path in sys.argv[1:] or [SHOTS_PATH]:
+        print(convert(csv_path))
@@ -0,0 +1,247 @@
+"""
+Shot source backed by an embedded DuckDB database.
+
+The shots live in the `shots` table of a DuckDB file, inserted in
+competition / season order so a partition predicate lets DuckDB skip whole
+row groups. Every question of the dashboard is a query: the dropdown
+selection becomes the WHERE clause, and the shot / goal / xG sums, the top
+scorers and the heat map binning are computed by DuckDB, so only small
+results reach Python and a worker's memory does not grow with the number of
+seasons loaded.
+
+Build, or extend, the database from shot CSVs (matches already in it are
+skipped, shots without an xG are scored by xg_model.py):
+
+    python duckdb_source.py shots.duckdb ../my_proj/all_shots_16_20.csv [more.csv ...]
+"""
+import hashlib
+import sys
+import threading
+import uuid
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from caching import SizedLRUCache
+from dataset import read_csv
+from heatmap_bins import as_bin_statistic
+from leaderboard import scorers_table
+from schema import SHOT_KEY
+from shot_cube import Totals
+from shot_filter import INDEXED_COLUMNS, as_list, covers, selection_key
+from xg_model import fill_missing
+
+
+def _create(db):
+    db.execute("CREATE TABLE IF NOT EXISTS meta (build_id VARCHAR)")
+    db.execute("CREATE TABLE IF NOT EXISTS partition_revisions "
+               "(competition_name VARCHAR, season_name VARCHAR, revision INTEGER, "
+               "PRIMARY KEY (competition_name, season_name))")
+    if db.execute("SELECT count(*) FROM meta").fetchone()[0] == 0:
+        db.execute("INSERT INTO meta VALUES (?)", [uuid.uuid4().hex])
+
+
+def _has_shots(db):
+    return db.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'shots'").fetchone()[0] > 0
+
+
+def _insert(db, rows):
+    """Add `rows` to the shots table; returns the (competition, season) pairs they touch."""
+    rows = rows.copy()
+    for column in rows.columns:
+        # plain strings, a DuckDB ENUM would refuse the names brought by later appends
+        if isinstance(rows[column].dtype, pd.CategoricalDtype):
+            rows[column] = rows[column].astype(object).where(rows[column].notna(), None)
+    db.register('new_rows', rows)
+    try:
+        if _has_shots(db):
+            db.execute("INSERT INTO shots BY NAME SELECT * FROM new_rows ORDER BY competition_name, season_name")
+        else:
+            db.execute("CREATE TABLE shots AS SELECT * FROM new_rows ORDER BY competition_name, season_name")
+        touched = db.execute("SELECT DISTINCT competition_name, season_name FROM new_rows").fetchall()
+    finally:
+        db.unregister('new_rows')
+    for competition, season in touched:
+        db.execute("INSERT INTO partition_revisions VALUES (?, ?, 0) "
+                   "ON CONFLICT DO UPDATE SET revision = revision + 1", [competition, season])
+    return touched
+
+
+def _where(competitions=None, seasons=None, team=None, player=None, extra=()):
+    clauses, params = list(extra), []
+    for column, values in zip(INDEXED_COLUMNS, (competitions, seasons, team, player)):
+        values = as_list(values)
+        if values:
+            clauses.append('{} IN ({})'.format(column, ', '.join('?' * len(values))))
+            params.extend(values)
+    return ('WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def _bin(value, edges, count):
+    # the bin scipy's binned_statistic (behind pitch.bin_statistic) puts `value` in, i.e.
+    # searchsorted(edges, value, side='right') - 1: a first guess from the even spacing, then checked against the
+    # edges themselves so values on an edge land exactly where scipy puts them; the last edge is in the last bin
+    k = 'CAST(floor(({v} - {e}[1]) / (({e}[-1] - {e}[1]) / {n})) AS INTEGER)'.format(v=value, e=edges, n=count)
+    return ('least({k} - CAST({e}[{k} + 1] > {v} AS INTEGER) + coalesce(CAST({e}[{k} + 2] <= {v} AS INTEGER), 0), '
+            '{last})').format(k=k, v=value, e=edges, last=count - 1)
+
+
+class DuckDBShotSource:
+
+    def __init__(self, path, pitch, top_k=7, read_only=False, bins=(45, 45), sigma=1, cache_bytes=32 * 2 ** 20):
+        self.path = path
+        self.top_k = top_k
+        self.sigma = sigma
+        self._db = duckdb.connect(path, read_only=read_only)
+        if not read_only:
+            _create(self._db)
+        self._local = threading.local()
+        self._dim = pitch.dim
+        self._grid = pitch.bin_statistic([pitch.dim.left], [pitch.dim.bottom], statistic='count', bins=bins)
+        self._shape = self._grid['statistic'].shape
+        self.smoothed = SizedLRUCache(cache_bytes,
+                                      sizeof=lambda stats: sum(s['statistic'].nbytes for s in stats))
+        self._build_id = self._db.execute("SELECT build_id FROM meta").fetchone()[0]
+        self._revisions = {(c, s): revision for c, s, revision in
+                           self._db.execute("SELECT * FROM partition_revisions").fetchall()}
+        self._listeners = []
+        self._append_lock = threading.Lock()
+
+    def _cursor(self):
+        # a DuckDB connection is not meant to be shared between threads, each gets its own cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._db.cursor()
+        return cursor
+
+    def _query(self, sql, params=()):
+        return self._cursor().execute(sql, list(params)).fetchall()
+
+    @property
+    def version(self):
+        return self.partition_version()
+
+    def partitions(self, competitions=None, seasons=None):
+        competitions, seasons = set(as_list(competitions)), set(as_list(seasons))
+        return sorted((c, s) for c, s in self._revisions if covers(competitions, seasons, c, s))
+
+    def partition_version(self, competitions=None, seasons=None):
+        covered = [(c, s, self._revisions[c, s]) for c, s in self.partitions(competitions, seasons)]
+        payload = repr((self._build_id, covered)).encode('utf8')
+        return hashlib.sha1(payload).hexdigest()[:16]
+
+    def subscribe(self, listener):
+        """Call `listener(rows, partitions)` after rows are appended (by this process)."""
+        self._listeners.append(listener)
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return []
+        with self._append_lock:
+            cursor = self._cursor()
+            touched = _insert(cursor, rows)
+            for competition, season in touched:
+                self._revisions[competition, season] = cursor.execute(
+                    "SELECT revision FROM partition_revisions WHERE competition_name = ? AND season_name = ?",
+                    [competition, season]).fetchone()[0]
+        self.smoothed.discard(lambda key: any(covers(key[0], key[1], c, s) for c, s in touched))
+        for listener in self._listeners:
+            listener(rows, touched)
+        return touched
+
+    def shot_keys(self, match_ids):
+        """The SHOT_KEY columns of the loaded shots of `match_ids`."""
+        return self._cursor().execute(
+            "SELECT {} FROM shots WHERE list_contains(?, match_id)".format(', '.join(SHOT_KEY)),
+            [[int(match_id) for match_id in match_ids]]).df()
+
+    def competitions(self):
+        return sorted({competition for competition, _ in self._revisions})
+
+    def seasons(self):
+        return sorted({season for _, season in self._revisions})
+
+    def _distinct(self, column, competitions=None, seasons=None, team=None):
+        where, params = _where(competitions, seasons, team, extra=['{} IS NOT NULL'.format(column)])
+        sql = "SELECT DISTINCT {0} FROM shots {1} ORDER BY {0}".format(column, where)
+        return [value for value, in self._query(sql, params)]
+
+    def teams(self, competitions=None, seasons=None):
+        return self._distinct('team_name', competitions, seasons)
+
+    def players(self, competitions=None, seasons=None, team=None):
+        return self._distinct('player_name', competitions, seasons, team)
+
+    def totals(self, competitions=None, seasons=None, team=None, player=None):
+        where, params = _where(competitions, seasons, team, player)
+        shots, goals, xg = self._query(
+            "SELECT count(*), coalesce(sum(CAST(Goal AS INTEGER)), 0), coalesce(sum(my_xg), 0) FROM shots " + where,
+            params)[0]
+        return Totals(int(shots), int(goals), float(xg))
+
+    def cells(self):
+        rows = self._query("SELECT competition_name, season_name, team_name, player_name, "
+                           "count(*), sum(CAST(Goal AS INTEGER)), sum(my_xg) FROM shots GROUP BY ALL")
+        return [((c, s, t, p), Totals(int(shots), int(goals), float(xg))) for c, s, t, p, shots, goals, xg in rows]
+
+    def top_scorers(self, competitions=None, seasons=None):
+        where, params = _where(competitions, seasons)
+        # same order as leaderboard.py: goals, then xG, then name
+        rows = self._query("SELECT player_name, sum(CAST(Goal AS INTEGER)) AS goals, sum(my_xg) AS xg, "
+                           "list(DISTINCT team_name) FROM shots {} GROUP BY player_name "
+                           "ORDER BY goals DESC, xg DESC, player_name LIMIT ?".format(where), params + [self.top_k])
+        return scorers_table([(player, int(goals), xg, set(teams)) for player, goals, xg, teams in rows], self.top_k)
+
+    def select(self, competitions=None, seasons=None, team=None, player=None, columns=None):
+        """Shots of the selection, in table order."""
+        where, params = _where(competitions, seasons, team, player)
+        names = ', '.join('"{}"'.format(column) for column in columns) if columns else '*'
+        # without an ORDER BY DuckDB returns the rows in whatever order its threads finish in
+        return self._cursor().execute("SELECT {} FROM shots {} ORDER BY rowid".format(names, where), params).df()
+
+    def counts(self, competitions=None, seasons=None):
+        """Shot and goal count grids of a selection, binned by DuckDB."""
+        where, params = _where(competitions, seasons)
+        rows, columns = self._shape
+        # bin_statistic bins y measured from the bottom of an inverted axis, in float32 like the data,
+        # and counts rows from the top
+        y = 'CAST({!r} AS FLOAT) - Y'.format(float(self._dim.bottom)) if self._dim.invert_y else 'Y'
+        sql = ("WITH edges AS (SELECT CAST(? AS DOUBLE[]) AS xe, CAST(? AS DOUBLE[]) AS ye), "
+               "points AS (SELECT CAST(X AS DOUBLE) AS x, CAST({y} AS DOUBLE) AS y, Goal FROM shots {where}) "
+               "SELECT {last_row} - {row} AS row, {col} AS col, count(*), count(*) FILTER (WHERE Goal) "
+               "FROM points, edges WHERE x BETWEEN xe[1] AND xe[-1] AND y BETWEEN ye[1] AND ye[-1] GROUP BY ALL"
+               ).format(y=y, where=where, last_row=rows - 1,
+                        row=_bin('y', 'ye', rows), col=_bin('x', 'xe', columns))
+        x_edges, y_edges = np.sort(self._grid['x_grid'][0]), np.sort(self._grid['y_grid'][:, 0])
+        params = [x_edges.astype(float).tolist(), y_edges.astype(float).tolist()] + params
+        shots, goals = np.zeros(self._shape), np.zeros(self._shape)
+        for row, col, shot_count, goal_count in self._query(sql, params):
+            shots[row, col] = shot_count
+            goals[row, col] = goal_count
+        return shots, goals
+
+    def heatmaps(self, competitions=None, seasons=None):
+        key = selection_key(competitions, seasons)
+        return self.smoothed.get_or_compute(
+            key, lambda: tuple(as_bin_statistic(self._grid, counts, self.sigma)
+                               for counts in self.counts(competitions, seasons)))
+
+
+def build(path, csv_paths):
+    """Create the database at `path`, or extend it, with the shots of `csv_paths`."""
+    db = duckdb.connect(path)
+    _create(db)
+    for csv_path in csv_paths:
+        rows = read_csv(csv_path)
+        if _has_shots(db):
+            known = [match_id for match_id, in db.execute("SELECT DISTINCT match_id FROM shots").fetchall()]
+            rows = rows[~rows['match_id'].isin(known)]
+        if len(rows):
+            _insert(db, fill_missing(rows))
+        print("{}: {} shots added".format(csv_path, len(rows)))
+    db.close()
+
+
+if __name__ == '__main__':
+    build(sys.argv[1], sys.argv[2:])
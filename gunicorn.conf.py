@@ -0,0 +1,33 @@
+"""
+gunicorn settings of the dashboard (see wsgi.py):
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+
+WEB_WORKERS processes (one per CPU by default) of WEB_THREADS threads each
+serve on BIND. The dataset is loaded once in the master before the workers
+are forked, except with the DuckDB backend: a DuckDB connection must not
+cross a fork, so every worker opens the database itself, and more than one
+worker needs it read-only.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', 3000)))
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# above RENDER_TIMEOUT, a slow figure is refused by the render pool before the worker is killed
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get('ACCESS_LOG', '-')
+
+preload_app = os.environ.get('SHOTS_BACKEND') != 'duckdb'
+if not preload_app and workers > 1:
+    os.environ.setdefault('SHOTS_DB_READ_ONLY', '1')
+
+
+def post_fork(server, worker):
+    # with preload_app wsgi is already imported, otherwise this loads the app in the worker
+    import wsgi
+    wsgi.post_fork()
@@ -0,0 +1,86 @@
+"""
+Pre-binned shot and goal counts for the heat map page.
+
+Every shot is binned once, in a single vectorised pass, into the 45x45 grid
+of the heat map pitch, and the counts are kept per (competition, season,
+team). The heat maps of a selection are then a sum of small arrays; the
+gaussian smoothing of that sum is memoised per selection.
+"""
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from caching import SizedLRUCache
+from shot_filter import PARTITION_COLUMNS, as_list, covers, selection_key
+
+GROUP_COLUMNS = PARTITION_COLUMNS + ['team_name']
+
+
+def as_bin_statistic(grid, counts, sigma):
+    """`grid` (a bin_statistic result) with the gaussian smoothed `counts` as its statistic."""
+    stats = dict(grid)
+    stats['statistic'] = gaussian_filter(counts, sigma)
+    return stats
+
+
+class HeatmapBins:
+
+    def __init__(self, pitch, df, bins=(45, 45), sigma=1, cache_bytes=32 * 2 ** 20):
+        self.pitch = pitch
+        self.bins = bins
+        self.sigma = sigma
+        # edges and centres only depend on the pitch and the number of bins
+        self._grid = pitch.bin_statistic([pitch.dim.left], [pitch.dim.bottom], statistic='count', bins=bins)
+        self._shape = self._grid['statistic'].shape
+        self._shots = {}  # (competition, season, team) -> counts
+        self._goals = {}
+        self.smoothed = SizedLRUCache(cache_bytes,
+                                      sizeof=lambda stats: sum(s['statistic'].nbytes for s in stats))
+        self.add(df)
+
+    def _histograms(self, rows):
+        """Counts per (competition, season, team) for shots and goals of `rows`."""
+        binned = self.pitch.bin_statistic(rows.X.to_numpy(), rows.Y.to_numpy(), statistic='count', bins=self.bins)
+        inside = binned['inside']
+        column, row = binned['binnumber'][:, inside]
+        cells = row * self._shape[1] + column
+
+        groups = rows[GROUP_COLUMNS].iloc[inside]
+        codes = groups.groupby(GROUP_COLUMNS, observed=True, sort=False).ngroup().to_numpy()
+        _, first = np.unique(codes, return_index=True)
+        keys = list(groups.iloc[first].itertuples(index=False, name=None))
+        size = self._shape[0] * self._shape[1]
+        flat = codes * size + cells
+        goal = rows['Goal'].to_numpy()[inside]
+        shots = np.bincount(flat, minlength=len(keys) * size).reshape(len(keys), *self._shape)
+        goals = np.bincount(flat[goal], minlength=len(keys) * size).reshape(len(keys), *self._shape)
+        return keys, shots.astype(np.int32), goals.astype(np.int32)
+
+    def add(self, rows):
+        """Bin newly loaded shots and drop the smoothed maps they change."""
+        if len(rows) == 0:
+            return
+        keys, shots, goals = self._histograms(rows)
+        for key, shot_counts, goal_counts in zip(keys, shots, goals):
+            # new arrays rather than += so a concurrent sum never sees half an update
+            self._shots[key] = self._shots[key] + shot_counts if key in self._shots else shot_counts
+            self._goals[key] = self._goals[key] + goal_counts if key in self._goals else goal_counts
+        touched = {(competition, season) for competition, season, _ in keys}
+        self.smoothed.discard(lambda key: any(covers(key[0], key[1], c, s) for c, s in touched))
+
+    def counts(self, competitions=None, seasons=None, team=None):
+        """Summed (shots, goals) count grids of a selection."""
+        competitions, seasons = set(as_list(competitions)), set(as_list(seasons))
+        keys = [key for key in list(self._shots)
+                if covers(competitions, seasons, key[0], key[1]) and (not team or key[2] == team)]
+        shots, goals = np.zeros(self._shape), np.zeros(self._shape)
+        for key in keys:
+            shots += self._shots[key]
+            goals += self._goals[key]
+        return shots, goals
+
+    def heatmaps(self, competitions=None, seasons=None):
+        """Smoothed shot and goal bin statistics of a selection, ready for `pitch.heatmap`."""
+        key = selection_key(competitions, seasons)
+        return self.smoothed.get_or_compute(
+            key, lambda: tuple(as_bin_statistic(self._grid, counts, self.sigma)
+                               for counts in self.counts(competitions, seasons)))
@@ -0,0 +1,190 @@
+"""
+Content addressed cache of the rendered pitch images.
+
+Images are looked up by a hash of everything that affects the drawing (the
+kind of image, the selection, the title and the dataset version). Entries are
+kept in memory up to a byte budget and, when a directory is given, also
+written to disk so they survive a restart of the app. Entries can be tagged
+(with the data partitions they were drawn from) so that an update of the
+dataset can drop just the images it affects. A key is only remembered under
+its tags while its image is still cached, in memory or on disk.
+
+`transcode` turns a rendered PNG into the format actually sent to the
+browser: WebP, or a 256 colour palette PNG, optionally resampled.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+from PIL import Image
+
+from caching import SizedLRUCache
+
+MIMETYPES = {'png': 'image/png', 'webp': 'image/webp'}
+
+
+def to_data_uri(png, mimetype='image/png'):
+    data = base64.b64encode(png).decode("utf8")  # encode to html elements
+    return "data:{};base64,{}".format(mimetype, data)
+
+
+def best_format(accept, formats=('webp', 'png')):
+    """The first of `formats` an Accept header allows; png, which every browser takes, otherwise."""
+    for fmt in formats:
+        if MIMETYPES[fmt] in accept:
+            return fmt
+    return 'png'
+
+
+def transcode(png, fmt='png', quality=80, scale=1.0):
+    """Re-encode a rendered PNG as WebP or palette PNG, `scale` resamples it (a lower DPI)."""
+    image = Image.open(io.BytesIO(png))
+    if scale != 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buf, format='webp', quality=quality, method=2)
+    else:
+        # the pitch, markers and text fit a 256 colour palette, at a fifth of the truecolour size
+        image.convert('RGB').quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, format='png')
+    return buf.getvalue()
+
+
+class ImageCache:
+
+    def __init__(self, max_bytes=128 * 2 ** 20, directory=None, max_disk_bytes=2 * 2 ** 30):
+        self.memory = SizedLRUCache(max_bytes, sizeof=len, on_evict=self._evicted)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self._tagged = {}  # tag -> keys of the entries carrying it
+        self._tags = {}  # key -> its tags
+        self._tags_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def key(*parts):
+        """Stable hash of the render parameters, usable as a file name."""
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.img')
+
+    def get(self, key):
+        image = self.memory.get(key)
+        if image is None and self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    image = f.read()
+            except OSError:
+                return None
+            self.disk_hits += 1
+            self.memory.put(key, image)
+        return image
+
+    def put(self, key, image, tags=()):
+        # tagged and on disk first, an image too big for memory is evicted (and untagged if not on disk) by put
+        if tags:
+            with self._tags_lock:
+                self._tags[key] = self._tags.get(key, frozenset()) | frozenset(tags)
+                for tag in tags:
+                    self._tagged.setdefault(tag, set()).add(key)
+        if self.directory:
+            self._write(key, image)
+        self.memory.put(key, image)
+        return image
+
+    def get_or_render(self, key, render, tags=()):
+        image = self.get(key)
+        if image is None:
+            image = self.put(key, render(), tags)
+        return image
+
+    def invalidate(self, tags):
+        """Drop every entry tagged with any of `tags`, from memory and disk."""
+        with self._tags_lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tagged.get(tag, set())
+            for key in keys:
+                self._untag_locked(key)
+        if not keys:
+            return
+        self.memory.discard(lambda key: key in keys)
+        if self.directory:
+            for key in keys:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def _evicted(self, key):
+        # an image evicted from memory may still be on disk, and still tagged
+        if not (self.directory and os.path.exists(self._path(key))):
+            self._untag(key)
+
+    def _untag(self, key):
+        with self._tags_lock:
+            self._untag_locked(key)
+
+    def _untag_locked(self, key):
+        for tag in self._tags.pop(key, ()):
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+
+    def _write(self, key, image):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so other workers never read a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+        with self._disk_lock:
+            self._disk_bytes += len(image)
+            if self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes:
+                self._prune_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.img'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _prune_disk(self):
+        # drop the oldest files until we are back under 90% of the budget
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            key = os.path.basename(path)[:-len('.img')]
+            if key not in self.memory:
+                self._untag(key)
+        self._disk_bytes = total
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update({'disk_hits': self.disk_hits, 'disk_bytes': self._disk_bytes})
+        return stats
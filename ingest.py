@@ -0,0 +1,97 @@
+"""
+Adding new matches to the running dashboard.
+
+`ingest_file` appends the shots of a CSV (same layout as all_shots_16_20.csv)
+to the live shot source (shot_source.py), skipping the shots that are already
+loaded, told apart by the SHOT_KEY columns of schema.py. A `ShotWatcher`
+polls a directory for new or updated CSV drops, e.g. one file per match, and
+ingests them from a background thread, so the app never has to be restarted
+(and lose its warm caches) to pick up new data. A file is only read once it
+has not changed for `settle` seconds, so one still being written is not
+taken half way, and a file written again later gets its new shots added.
+
+Shots dropped without their xG are scored on load by `model` (xg_model.py),
+and with `rescore` every ingested shot is re-scored with it.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from dataset import read_csv
+from schema import SHOT_KEY, SHOT_SCHEMA
+from xg_model import DEFAULT_MODEL, fill_missing, score_frame
+
+logger = logging.getLogger(__name__)
+
+
+def _shot_keys(df):
+    return pd.MultiIndex.from_frame(df[SHOT_KEY].astype({column: SHOT_SCHEMA[column] for column in SHOT_KEY}))
+
+
+def ingest_file(shots, path, model=DEFAULT_MODEL, rescore=False):
+    """Append the not yet loaded shots of `path` to `shots`; returns the number of rows added."""
+    rows = read_csv(path)
+    known = _shot_keys(rows).isin(_shot_keys(shots.shot_keys(rows['match_id'].unique())))
+    rows = rows[~known]
+    rows = score_frame(rows, model) if rescore else fill_missing(rows, model)
+    shots.append(rows)
+    return len(rows)
+
+
+class ShotWatcher:
+
+    def __init__(self, shots, directory, pattern='*.csv', interval=30, model=DEFAULT_MODEL, rescore=False,
+                 settle=10):
+        self.shots = shots
+        self.model = model
+        self.rescore = rescore
+        self.directory = directory
+        self.pattern = pattern
+        self.interval = interval
+        self.settle = settle
+        self._seen = {}  # path -> mtime it was ingested at
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Ingest the files that appeared or changed since the last poll."""
+        added = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self._seen.get(path) == mtime:
+                continue
+            if time.time() - mtime < self.settle:
+                # still being written, maybe: taken on a later poll once it stops changing
+                continue
+            try:
+                count = ingest_file(self.shots, path, self.model, self.rescore)
+            except Exception:
+                # a file still being written or malformed, retried on the next poll
+                logger.exception("Could not ingest %s", path)
+                continue
+            self._seen[path] = mtime
+            added += count
+            logger.info("Ingested %d shots from %s", count, path)
+        return added
+
+    def _run(self):
+        while True:
+            self.poll()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='shot-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
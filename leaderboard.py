@@ -0,0 +1,90 @@
+"""
+Top scorers table of the Goals Analysis page.
+
+Goal and xG totals are kept per player for every (competition, season)
+partition, each partition's players pre-sorted by (goals, xG). A query for a
+single partition reads the head of its list; several partitions are merged
+per player and the top k taken with a heap. Neither depends on the number of
+shots, only on the number of players in the selected partitions.
+"""
+import heapq
+import threading
+
+import pandas as pd
+
+from shot_filter import PARTITION_COLUMNS, as_list, covers
+
+
+def _rank(item):
+    # most goals first, ties broken by the higher xG, then by name for a stable order
+    player, (goals, xg, _) = item
+    return goals, xg, _Reversed(player)
+
+
+def scorers_table(top, k):
+    """(player, goals, xg, teams) of the best scorers as the team_name / player_name / Goal frame shown on the page."""
+    rows = [(team, player, goals) for player, goals, _, teams in top for team in sorted(teams)]
+    return pd.DataFrame(rows[:k], columns=['team_name', 'player_name', 'Goal'])
+
+
+class _Reversed:
+    # inverts string order inside a descending sort
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class Leaderboard:
+
+    def __init__(self, df, k=7):
+        self.k = k
+        self._partitions = {}  # (competition, season) -> {player: (goals, xg, teams)}
+        self._ranked = {}  # (competition, season) -> players sorted by _rank
+        self._lock = threading.Lock()
+        self.add(df)
+
+    def add(self, rows):
+        """Fold newly loaded shots into the per partition totals."""
+        players = rows.groupby(PARTITION_COLUMNS + ['player_name', 'team_name'], observed=True).agg(
+            goals=('Goal', 'sum'), xg=('my_xg', 'sum'))
+        with self._lock:
+            # updated copies are swapped in, so queries never iterate a partition being changed
+            updated = {}
+            for (competition, season, player, team), goals, xg in players.itertuples(name=None):
+                key = (competition, season)
+                if key not in updated:
+                    updated[key] = dict(self._partitions.get(key, {}))
+                partition = updated[key]
+                old_goals, old_xg, teams = partition.get(player, (0, 0.0, frozenset()))
+                partition[player] = (old_goals + int(goals), old_xg + float(xg), teams | {team})
+            for key, partition in updated.items():
+                self._partitions[key] = partition
+                self._ranked[key] = sorted(partition.items(), key=_rank, reverse=True)
+
+    def top(self, competitions=None, seasons=None, k=None):
+        """The k best (player, goals, xg, teams) of the selection."""
+        k = k or self.k
+        competitions, seasons = set(as_list(competitions)), set(as_list(seasons))
+        keys = [(c, s) for c, s in list(self._ranked) if covers(competitions, seasons, c, s)]
+        if len(keys) == 1:
+            best = self._ranked[keys[0]][:k]
+        else:
+            merged = {}
+            for key in keys:
+                for player, (goals, xg, teams) in self._partitions[key].items():
+                    old_goals, old_xg, old_teams = merged.get(player, (0, 0.0, frozenset()))
+                    merged[player] = (old_goals + goals, old_xg + xg, old_teams | teams)
+            best = heapq.nlargest(k, merged.items(), key=_rank)
+        return [(player, goals, xg, teams) for player, (goals, xg, teams) in best]
+
+    def table(self, competitions=None, seasons=None, k=None):
+        """Top scorers as the team_name / player_name / Goal frame shown on the page."""
+        k = k or self.k
+        return scorers_table(self.top(competitions, seasons, k), k)
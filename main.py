@@ -1,19 +1,94 @@
 import dash
 from dash import dcc
 from dash import html
+from dash.exceptions import PreventUpdate
 
 import dash_bootstrap_components as dbc
-import matplotlib as mpl
-from mplsoccer import Pitch, VerticalPitch, FontManager
+from mplsoccer import Pitch, FontManager
 import matplotlib.patheffects as path_effects
 import pandas as pd
 from matplotlib.colors import LinearSegmentedColormap
-from scipy.ndimage import gaussian_filter
-import matplotlib.pyplot as plt
-import io
-import base64
-
-df = pd.read_csv('../my_proj/all_shots_16_20.csv')
+import flask
+import functools
+import hmac
+import importlib.util
+import json
+import os
+import tempfile
+from urllib.parse import urlencode
+
+from client_data import encode_shots, encode_totals, pitch_layout
+from dataset import load_shots
+from image_cache import MIMETYPES, ImageCache, best_format, to_data_uri, transcode
+from ingest import ShotWatcher
+from metrics import UNKNOWN, CallbackMetrics
+from profiler import SlowRequestProfiler
+from render_pool import RenderBusy, RenderCrashed, RenderPool, RenderTimeout
+from rendering import (DEFAULT_DPI, DPI_TIERS, choose_dpi, render_heatmap, render_placeholder, render_xg_map,
+                       style_pitch)
+from shot_filter import INDEXED_COLUMNS, selection_key
+from shot_source import PandasShotSource
+from xg_model import DEFAULT_MODEL, load_model, score_frame
+
+# XG_MODEL is a model file written by xg_training.py, or a directory of them to take the latest from; it scores
+# the incoming shots that have no xG, and with XG_RESCORE=1 every shot loaded or ingested, replacing my_xg
+xg_model = load_model(os.environ['XG_MODEL']) if os.environ.get('XG_MODEL') else DEFAULT_MODEL
+XG_RESCORE = os.environ.get('XG_RESCORE') == '1'
+
+# per callback timings, response sizes and cache hits, served on /metrics in the Prometheus text format;
+# METRICS=0 turns the instrumentation off, DEBUG_PANEL=1 also shows the numbers below the pages
+METRICS = os.environ.get('METRICS', '1') != '0'
+DEBUG_PANEL = METRICS and os.environ.get('DEBUG_PANEL') == '1'
+metrics = CallbackMetrics()
+
+# xG map and heat map requests slower than PROFILE_THRESHOLD seconds leave a stack sampling profile (folded
+# stacks, for flamegraph.pl or speedscope) and their selection in PROFILE_DIR, the PROFILE_KEEP latest ones;
+# PROFILE_SLOW_REQUESTS=1 starts with it on, /admin/profiler switches it at runtime (see profiler.py)
+profiler = SlowRequestProfiler(os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'shot_profiles')),
+                               threshold=float(os.environ.get('PROFILE_THRESHOLD', 2)),
+                               keep=int(os.environ.get('PROFILE_KEEP', 50)),
+                               enabled=os.environ.get('PROFILE_SLOW_REQUESTS') == '1')
+# the /admin routes answer requests carrying this token in an X-Admin-Token header, and none without it set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# SHOTS_BACKEND=duckdb queries the DuckDB file SHOTS_DB (see duckdb_source.py) instead of holding
+# every shot in memory; SHOTS_DB_READ_ONLY=1 lets several server processes open it (but not ingest into it)
+if os.environ.get('SHOTS_BACKEND') == 'duckdb':
+    from duckdb_source import DuckDBShotSource
+    shots = DuckDBShotSource(os.environ.get('SHOTS_DB', 'shots.duckdb'), style_pitch('heatmap'),
+                             top_k=int(os.environ.get('TOP_SCORERS', 7)),
+                             read_only=os.environ.get('SHOTS_DB_READ_ONLY') == '1')
+else:
+    shots = PandasShotSource(score_frame(load_shots(), xg_model) if XG_RESCORE else load_shots(),
+                             style_pitch('heatmap'), top_k=int(os.environ.get('TOP_SCORERS', 7)))
+if METRICS:
+    # the callbacks filter and aggregate through the shot source, its calls are their filter time
+    shots = metrics.timed(shots, 'filter')
+
+# BACKGROUND_RENDER=1 draws the images in background jobs (needs diskcache, multiprocess and psutil):
+# the page gets the bare pitch at once and the image when its job is done
+background_manager = None
+if os.environ.get('BACKGROUND_RENDER'):
+    import diskcache
+    background_manager = dash.DiskcacheManager(diskcache.Cache(
+        os.environ.get('BACKGROUND_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'shot_jobs'))))
+
+# rendered PNGs, optionally persisted on disk between restarts
+# (always with background jobs, the disk is how their images reach the server process)
+image_dir = os.environ.get('IMAGE_CACHE_DIR')
+if background_manager is not None and not image_dir:
+    image_dir = os.path.join(tempfile.gettempdir(), 'shot_images')
+images = ImageCache(directory=image_dir)
+shots.subscribe(lambda rows, partitions: images.invalidate(partitions))
+# figures are drawn in worker processes, RENDER_WORKERS=0 draws them in the request thread
+renderer = RenderPool(workers=int(os.environ.get('RENDER_WORKERS', 2)),
+                      max_pending=int(os.environ.get('RENDER_MAX_PENDING', 8)),
+                      timeout=float(os.environ.get('RENDER_TIMEOUT', 30)))
+
+# new match files dropped in this directory are added to the live dataset (polled once `start` is called)
+watcher = None
+if os.environ.get('SHOTS_INCOMING_DIR'):
+    watcher = ShotWatcher(shots, os.environ['SHOTS_INCOMING_DIR'], model=xg_model, rescore=XG_RESCORE)
 
 # Fonts
 robotto_regular = FontManager()
@@ -26,8 +101,60 @@ path_eff = [path_effects.Stroke(linewidth=1.5, foreground='black'),
 pearl_earring_cmap = LinearSegmentedColormap.from_list("Pearl Earring - 10 colors",
                                                        ['#15242e', '#4393c4'], N=10)
 
+# SHOT_MAP_MODE=client ships the shots to the browser once per page load and draws the xG map there
+# (assets/shot_map.js) instead of rendering a PNG on the server per selection
+SHOT_MAP_MODE = os.environ.get('SHOT_MAP_MODE', 'image')
+
+
+@functools.lru_cache(maxsize=1)
+def client_shots(version):
+    return encode_shots(shots.select(columns=['X', 'Y', 'my_xg', 'Goal'] + INDEXED_COLUMNS))
+
+
+@functools.lru_cache(maxsize=None)
+def client_pitch():
+    return pitch_layout('xg_map')
+
+
+def shot_map():
+    if SHOT_MAP_MODE == 'client':
+        return [dcc.Graph(id='shooting_xg_graph', config={'displayModeBar': False}, style={'height': '440px'}),
+                dcc.Store(id='shot_data', data=client_shots(shots.version)),
+                dcc.Store(id='pitch_layout', data=client_pitch())]
+    return [html.Img(id='shooting_xg', style={'width': '100%'}),
+            dcc.Store(id='shooting_xg_job')]
+
+
+# SUMMARY_CARDS=client ships the shot cube once per page load and computes the cards in the browser
+# (assets/summary_cards.js) instead of with six server callbacks
+SUMMARY_CARDS = os.environ.get('SUMMARY_CARDS', 'server')
+
+
+@functools.lru_cache(maxsize=1)
+def client_totals(version):
+    return encode_totals(shots)
+
+
+def card_totals():
+    if SUMMARY_CARDS == 'client':
+        return [dcc.Store(id='card_totals', data=client_totals(shots.version))]
+    return []
+
+
+# the image callbacks return a URL of the /images route, which serves WebP or palette PNG with an ETag,
+# so revisiting a selection costs a 304; IMAGE_ROUTE=0 puts the PNG in the callback response instead
+IMAGE_ROUTE = os.environ.get('IMAGE_ROUTE', '1') != '0'
+IMAGE_FORMATS = tuple(os.environ.get('IMAGE_FORMATS', 'webp,png').split(','))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+# below 1 the images are resampled to a lower DPI
+IMAGE_SCALE = float(os.environ.get('IMAGE_SCALE', 1))
+IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', 3600))
+
 # https://www.bootstrapcdn.com/bootswatch/
+# callback responses are gzip / brotli compressed when flask-compress is installed
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SOLAR],
+                compress=importlib.util.find_spec('flask_compress') is not None,
+                background_callback_manager=background_manager,
                 meta_tags=[{'name': 'viewport',
                             'content': 'width=device-width, initial-scale=1.0'}]
                 )
@@ -47,266 +174,270 @@ nav_bar = dbc.NavbarSimple(
 
 page_content = html.Div(id = "page_content", children=[])
 
-container = dbc.Container([
 
-    dbc.Row([
-        dbc.Col(html.H1("Player Shooting Analysis"),
-                className="text-center mb-4",
-                width=12,
+def container():
+    # built per page load so the options follow the live dataset
+    return dbc.Container([
+
+        dbc.Row([
+            dbc.Col(html.H1("Player Shooting Analysis"),
+                    className="text-center mb-4",
+                    width=12,
+                    )
+        ]),
+        dbc.Row([
+            dbc.Col([
+                html.H3('Competition:'),
+                dcc.Dropdown(
+                    id='competition_select',
+                    multi=True,
+                    value=["La Liga"],
+                    options=[{'label': x, 'value': x} for x in shots.competitions()]
                 )
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.H3('Competition:'),
-            dcc.Dropdown(
-                id='competition_select',
-                multi=True,
-                value=["La Liga"],
-                options=[{'label': x, 'value': x} for x in df['competition_name'].unique()]
-            )
-        ], xs=12, sm=12, md=12, lg=5, xl=5
-        ),
-
-        dbc.Col([
-            html.H3('Season:'),
-            dcc.Dropdown(
-                id='season_select',
-                multi=True,
-                value=["2019/2020"],
-                options=[{'label': x, 'value': x} for x in df['season_name'].unique()]
-            )
-        ], xs=12, sm=12, md=12, lg=5, xl=5),
-
-        dbc.Col([
-            html.H3('Team: '),
-            dcc.Dropdown(
-                id='team_select',
-                options=[{'label': x, 'value': x} for x in df['team_name'].unique()]
+            ], xs=12, sm=12, md=12, lg=5, xl=5
             ),
-        ], xs=12, sm=12, md=12, lg=5, xl=5),
 
-        dbc.Col([
-            html.H3('Player: '),
-            dcc.Dropdown(
-                id='player_select',
-                options=[{'label': x, 'value': x} for x in df['player_name'].unique()]
+            dbc.Col([
+                html.H3('Season:'),
+                dcc.Dropdown(
+                    id='season_select',
+                    multi=True,
+                    value=["2019/2020"],
+                    options=[{'label': x, 'value': x} for x in shots.seasons()]
+                )
+            ], xs=12, sm=12, md=12, lg=5, xl=5),
+
+            dbc.Col([
+                html.H3('Team: '),
+                dcc.Dropdown(
+                    id='team_select',
+                    options=[{'label': x, 'value': x} for x in shots.teams()]
+                ),
+            ], xs=12, sm=12, md=12, lg=5, xl=5),
+
+            dbc.Col([
+                html.H3('Player: '),
+                dcc.Dropdown(
+                    id='player_select',
+                    options=[{'label': x, 'value': x} for x in shots.players()]
+                ),
+            ], xs=12, sm=12, md=12, lg=5, xl=5)
+
+        ]),
+        dbc.Row([
+            html.Br()
+        ]),
+        dbc.Row([
+            html.Hr()
+        ]),
+        dbc.Row([
+
+            dbc.Col([
+                dbc.Row([html.Div(id='player_card_number_shoots-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+                dbc.Row([html.Div(id='player_card_number_goals-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+                dbc.Row([html.Div(id='player_avg_goal_percent-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+            ] + card_totals(), xs=12, sm=12, md=12, lg=3, xl=3, style={"justify-content": "center"}
             ),
-        ], xs=12, sm=12, md=12, lg=5, xl=5)
-
-    ]),
-    dbc.Row([
-        html.Br()
-    ]),
-    dbc.Row([
-        html.Hr()
-    ]),
-    dbc.Row([
-
-        dbc.Col([
-            dbc.Row([html.Div(id='player_card_number_shoots-output-container',
-                              style={"justify-content": "center"})], align="center"),
-            dbc.Row([html.Div(id='player_card_number_goals-output-container',
-                              style={"justify-content": "center"})], align="center"),
-            dbc.Row([html.Div(id='player_avg_goal_percent-output-container',
-                              style={"justify-content": "center"})], align="center"),
-        ], xs=12, sm=12, md=12, lg=3, xl=3, style={"justify-content": "center"}
-        ),
-        dbc.Col([
-            html.Img(id='shooting_xg')
-
-        ], xs=12, sm=12, md=12, lg=4, xl=4)
-
-    ])
-
-], fluid=True)
-
-
-container_2 = dbc.Container([
-    dbc.Row([
-        dbc.Col(html.H1("Goals Analysis"),
-                className="text-center mb-4",
-                width=12,
+            dbc.Col(shot_map(), xs=12, sm=12, md=12, lg=4, xl=4)
+
+        ])
+
+    ], fluid=True)
+
+
+def container_2():
+    # built per page load so the options follow the live dataset
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(html.H1("Goals Analysis"),
+                    className="text-center mb-4",
+                    width=12,
+                    )
+        ]),
+        dbc.Row([
+            dbc.Col([
+                html.H3('Competition:'),
+                dcc.Dropdown(
+                    id='competition_select',
+                    multi=True,
+                    value=["La Liga"],
+                    options=[{'label': x, 'value': x} for x in shots.competitions()]
                 )
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.H3('Competition:'),
-            dcc.Dropdown(
-                id='competition_select',
-                multi=True,
-                value=["La Liga"],
-                options=[{'label': x, 'value': x} for x in df['competition_name'].unique()]
-            )
-        ], xs=12, sm=12, md=12, lg=5, xl=5
-        ),
-
-        dbc.Col([
-            html.H3('Season:'),
-            dcc.Dropdown(
-                id='season_select',
-                multi=True,
-                value=["2019/2020"],
-                options=[{'label': x, 'value': x} for x in df['season_name'].unique()]
-            )
-        ], xs=12, sm=12, md=12, lg=5, xl=5)
-    ]),
-    dbc.Row([
-        html.Br()
-    ]),
-    dbc.Row([
-        html.Hr()
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.H3('Top Scorers:')
-        ], xs=12, sm=12, md=12, lg=4, xl=5)
-    ]),
-    dbc.Row([
-
-        dbc.Col([
-            html.Div(id='table_top_scorers-output-container')
-        ], xs=12, sm=12, md=12, lg=3, xl=3),
-
-        dbc.Col([
-            dbc.Row([html.Div(id='card_number_shoots-output-container',
-                              style={"justify-content": "center"})], align="center"),
-            dbc.Row([html.Div(id='card_number_goals-output-container',
-                              style={"justify-content": "center"})], align="center"),
-            dbc.Row([html.Div(id='avg_goal_percent-output-container',
-                              style={"justify-content": "center"})], align="center"),
-        ], xs=12, sm=12, md=12, lg=2, xl=2, style={"justify-content": "center"}
-        ),
-
-        dbc.Col([
-            html.Img(id='shoot_heatmap')
-
-        ], xs=12, sm=12, md=12, lg=4, xl=4)
-    ])
-
-], fluid=True)
+            ], xs=12, sm=12, md=12, lg=5, xl=5
+            ),
+
+            dbc.Col([
+                html.H3('Season:'),
+                dcc.Dropdown(
+                    id='season_select',
+                    multi=True,
+                    value=["2019/2020"],
+                    options=[{'label': x, 'value': x} for x in shots.seasons()]
+                )
+            ], xs=12, sm=12, md=12, lg=5, xl=5)
+        ]),
+        dbc.Row([
+            html.Br()
+        ]),
+        dbc.Row([
+            html.Hr()
+        ]),
+        dbc.Row([
+            dbc.Col([
+                html.H3('Top Scorers:')
+            ], xs=12, sm=12, md=12, lg=4, xl=5)
+        ]),
+        dbc.Row([
+
+            dbc.Col([
+                html.Div(id='table_top_scorers-output-container')
+            ], xs=12, sm=12, md=12, lg=3, xl=3),
+
+            dbc.Col([
+                dbc.Row([html.Div(id='card_number_shoots-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+                dbc.Row([html.Div(id='card_number_goals-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+                dbc.Row([html.Div(id='avg_goal_percent-output-container',
+                                  style={"justify-content": "center"})], align="center"),
+            ] + card_totals(), xs=12, sm=12, md=12, lg=2, xl=2, style={"justify-content": "center"}
+            ),
+
+            dbc.Col([
+                html.Img(id='shoot_heatmap', style={'width': '100%'}),
+                dcc.Store(id='shoot_heatmap_job')
+
+            ], xs=12, sm=12, md=12, lg=4, xl=4)
+        ])
+
+    ], fluid=True)
 
 container_3 = dbc.Container([])
 
 
+def debug_panel():
+    if not DEBUG_PANEL:
+        return []
+    return [html.Details([html.Summary("Callback metrics"), html.Div(id='metrics_panel')],
+                         style={'margin': '20px'}),
+            dcc.Interval(id='metrics_interval', interval=5000)]
+
+
 app.layout = html.Div(
     [dcc.Location(id='url', refresh=False),
+    dcc.Store(id='viewport'),
     nav_bar,
-    page_content]
+    page_content] + debug_panel()
 )
 
+# size of the browser window, the images are drawn at the DPI tier that fills their column
+app.clientside_callback(
+    """
+    function(pathname) {
+        return {width: window.innerWidth, ratio: window.devicePixelRatio || 1};
+    }
+    """,
+    dash.dependencies.Output('viewport', 'data'),
+    [dash.dependencies.Input('url', 'pathname')])
 
 
 
-################################################################################
-
 
+################################################################################
 
-@app.callback(
-    dash.dependencies.Output('player_card_number_shoots-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')],
-    [dash.dependencies.Input('team_select', 'value')],
-    [dash.dependencies.Input('player_select', 'value')])
-def update_table(selected_competition, selected_season, team_select, player_select):
-    dff = df
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-    if selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-    if team_select:
-        dff = dff[dff['team_name'] == team_select]
-    if player_select:
-        dff = dff[dff['player_name'] == player_select]
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Number of Shoots:", className="card-title"),
-                html.H3(
-                    "{}".format(len(dff)),
-                    className="card-text",
-                )
-            ]
-        ), color="warning", inverse=True, style={"width": "18rem"}
-    )
 
-@app.callback(
-    dash.dependencies.Output('player_card_number_goals-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')],
-    [dash.dependencies.Input('team_select', 'value')],
-    [dash.dependencies.Input('player_select', 'value')])
-def update_table(selected_competition, selected_season, team_select, player_select):
-    dff = df
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-    if selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-    if team_select:
-        dff = dff[dff['team_name'] == team_select]
-    if player_select:
-        dff = dff[dff['player_name'] == player_select]
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Number of Goals:", className="card-title"),
-                html.H3(
-                    "{}".format(len(dff[dff["Goal"]])),
-                    className="card-text",
-                )
-            ]
-        ), color="success", inverse=True, style={"width": "18rem", "margin-top": "5px"}
-    )
-
-
-@app.callback(
-    dash.dependencies.Output('player_avg_goal_percent-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')],
-    [dash.dependencies.Input('team_select', 'value')],
-    [dash.dependencies.Input('player_select', 'value')])
-def update_table(selected_competition, selected_season, team_select, player_select):
-    dff = df
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-    if selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-    if team_select:
-        dff = dff[dff['team_name'] == team_select]
-    if player_select:
-        dff = dff[dff['player_name'] == player_select]
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Average goal percentage:", className="card-title"),
-                html.H3(
-                    "{} %".format(round((len(dff[dff["Goal"]]) / len(dff)) * 100, 2)),
-                    className="card-text",
-                )
-            ]
-        ), color="primary", inverse=True, style={"width": "18rem", "margin-top": "5px"}
-    )
+if SUMMARY_CARDS == 'client':
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction('summary_cards', 'player'),
+        [dash.dependencies.Output('player_card_number_shoots-output-container', 'children'),
+         dash.dependencies.Output('player_card_number_goals-output-container', 'children'),
+         dash.dependencies.Output('player_avg_goal_percent-output-container', 'children')],
+        [dash.dependencies.Input('competition_select', 'value'),
+         dash.dependencies.Input('season_select', 'value'),
+         dash.dependencies.Input('team_select', 'value'),
+         dash.dependencies.Input('player_select', 'value'),
+         dash.dependencies.Input('card_totals', 'data')])
+
+else:
+    @app.callback(
+        dash.dependencies.Output('player_card_number_shoots-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')],
+        [dash.dependencies.Input('team_select', 'value')],
+        [dash.dependencies.Input('player_select', 'value')])
+    def update_player_shots_card(selected_competition, selected_season, team_select, player_select):
+        totals = shots.totals(selected_competition, selected_season, team_select, player_select)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Number of Shoots:", className="card-title"),
+                    html.H3(
+                        "{}".format(totals.shots),
+                        className="card-text",
+                    )
+                ]
+            ), color="warning", inverse=True, style={"width": "18rem"}
+        )
+
+    @app.callback(
+        dash.dependencies.Output('player_card_number_goals-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')],
+        [dash.dependencies.Input('team_select', 'value')],
+        [dash.dependencies.Input('player_select', 'value')])
+    def update_player_goals_card(selected_competition, selected_season, team_select, player_select):
+        totals = shots.totals(selected_competition, selected_season, team_select, player_select)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Number of Goals:", className="card-title"),
+                    html.H3(
+                        "{}".format(totals.goals),
+                        className="card-text",
+                    )
+                ]
+            ), color="success", inverse=True, style={"width": "18rem", "margin-top": "5px"}
+        )
+
+
+    @app.callback(
+        dash.dependencies.Output('player_avg_goal_percent-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')],
+        [dash.dependencies.Input('team_select', 'value')],
+        [dash.dependencies.Input('player_select', 'value')])
+    def update_player_goal_percent_card(selected_competition, selected_season, team_select, player_select):
+        totals = shots.totals(selected_competition, selected_season, team_select, player_select)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Average goal percentage:", className="card-title"),
+                    html.H3(
+                        "{} %".format(totals.goal_percent),
+                        className="card-text",
+                    )
+                ]
+            ), color="primary", inverse=True, style={"width": "18rem", "margin-top": "5px"}
+        )
 
 
 @app.callback(
     dash.dependencies.Output('team_select', 'options'),
     [dash.dependencies.Input('competition_select', 'value')],
     [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    dff = df
-    if selected_competition:
-        dff = dff[dff["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-
-    if len(dff) == 0:
+def update_team_options(selected_competition, selected_season):
+    teams = shots.teams(selected_competition, selected_season)
+
+    if len(teams) == 0:
         return ['']
     else:
-        return [{'label': x, 'value': x} for x in dff['team_name'].unique()]
+        return [{'label': x, 'value': x} for x in teams]
 
 
 @app.callback(
@@ -314,273 +445,409 @@ def update_table(selected_competition, selected_season):
     [dash.dependencies.Input('competition_select', 'value')],
     [dash.dependencies.Input('season_select', 'value')],
     [dash.dependencies.Input('team_select', 'value')])
-def update_table(selected_competition, selected_season, team_select):
-    dff = df
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-    if selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-    if team_select:
-        dff = dff[dff['team_name'] == team_select]
-    
-
-    if len(dff) == 0:
-        return ['']
-    else:
-        return [{'label': x, 'value': x} for x in dff['player_name'].unique()]
-
+def update_player_options(selected_competition, selected_season, team_select):
+    players = shots.players(selected_competition, selected_season, team_select)
 
-@app.callback(
-    dash.dependencies.Output('shooting_xg', 'src'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')],
-    [dash.dependencies.Input('team_select', 'value')],
-    [dash.dependencies.Input('player_select', 'value')])
-def update_table(selected_competition, selected_season, team_select, player_select):
-    dff = df
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-    if selected_season:
-        dff = dff[dff["season_name"].isin(selected_season)]
-    if team_select:
-        dff = dff[dff['team_name'] == team_select]
-    if player_select:
-        dff = dff[dff['player_name'] == player_select]
-
-    mpl.rcParams.update({'text.color': "white",
-                         'axes.labelcolor': "white"})
-
-    dff_goals = dff[dff.Goal == True].copy()
-    dff_non_goals = dff[dff.Goal != True].copy()
-
-    buf = io.BytesIO()
-    
-
-    pitch = VerticalPitch(pad_bottom=0.5,  # pitch extends slightly below halfway line
-                      half=True,  # half of a pitch
-                      goal_type='box',
-                      goal_alpha=0.8,
-                      pitch_color='grass',
-                      line_color='white',
-                      stripe=True
-                     )
-
-    fig, ax = pitch.draw(figsize=(12, 10))
-
-    # plot non-goal shots with hatch
-    sc1 = pitch.scatter(dff_non_goals.X, dff_non_goals.Y,
-                    # size varies between 100 and 1900 (points squared)
-                    s=(dff_non_goals.my_xg * 1900) + 100,
-                    edgecolors='#b94b75',  # give the markers a charcoal border
-                    c='None',  # no facecolor for the markers
-                    hatch='///',  # the all important hatch (triple diagonal lines)
-                    # for other markers types see: https://matplotlib.org/api/markers_api.html
-                    marker='o',
-                    ax=ax)
-
-    # plot goal shots with a football marker
-    # 'edgecolors' sets the color of the pentagons and edges, 'c' sets the color of the hexagons
-    pitch.scatter(dff_goals.X, dff_goals.Y,
-                   
-                    s=(dff_goals.my_xg * 1900) + 100,
-                    edgecolors='blue',
-                    linewidth=0.6,
-                    c='white',
-                    marker='football',
-                    ax=ax)
-    if player_select:
-        ax.text(x=40, y=80, s='{}\n{}'.format(player_select, selected_competition[0]),
-                size=30,
-                color=pitch.line_color,
-                va='center', ha='center')
-    elif selected_competition:
-        ax.text(x=40, y=80, s='{}'.format(selected_competition[0]),
-                size=30,
-                color=pitch.line_color,
-                va='center', ha='center')
+    if len(players) == 0:
+        return ['']
     else:
-        ax.text(x=40, y=80, s='XGoal Analysis',
-                size=30,
-                color=pitch.line_color,
-                va='center', ha='center')
-
-    
-
-    plt.savefig(buf, format="png", bbox_inches='tight')
-
-    plt.close()
-    data = base64.b64encode(buf.getbuffer()).decode("utf8")  # encode to html elements
-    return "data:image/png;base64,{}".format(data)
-
+        return [{'label': x, 'value': x} for x in players]
 
 
 @app.callback(
     dash.dependencies.Output('table_top_scorers-output-container', 'children'),
     [dash.dependencies.Input('competition_select', 'value')],
     [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = df[df["season_name"].isin(selected_season)]
-    else:
-        dff = df
-    return dbc.Table.from_dataframe(pd.concat([dff[["team_name", "player_name"]],
-                                               dff['Goal'].groupby(dff['player_name']).transform('sum')],
-                                              axis=1).drop_duplicates().sort_values("Goal",
-                                                                                    ascending=False).head(7),
+def update_top_scorers(selected_competition, selected_season):
+    return dbc.Table.from_dataframe(shots.top_scorers(selected_competition, selected_season),
                                     striped=True,
                                     bordered=True, hover=True)
 
 
-@app.callback(
-    dash.dependencies.Output('card_number_shoots-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = df[df["season_name"].isin(selected_season)]
-    else:
-        dff = df
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Number of Shoots:", className="card-title"),
-                html.H3(
-                    "{}".format(len(dff)),
-                    className="card-text",
-                )
-            ]
-        ), color="warning", inverse=True, style={"width": "18rem"}
-    )
-
-
-@app.callback(
-    dash.dependencies.Output('card_number_goals-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = df[df["season_name"].isin(selected_season)]
-    else:
-        dff = df
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Number of Goals:", className="card-title"),
-                html.H3(
-                    "{}".format(len(dff[dff["Goal"]])),
-                    className="card-text",
-                )
-            ]
-        ), color="success", inverse=True, style={"width": "18rem", "margin-top": "5px"}
-    )
-
-
-@app.callback(
-    dash.dependencies.Output('avg_goal_percent-output-container', 'children'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = df[df["season_name"].isin(selected_season)]
+if SUMMARY_CARDS == 'client':
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction('summary_cards', 'league'),
+        [dash.dependencies.Output('card_number_shoots-output-container', 'children'),
+         dash.dependencies.Output('card_number_goals-output-container', 'children'),
+         dash.dependencies.Output('avg_goal_percent-output-container', 'children')],
+        [dash.dependencies.Input('competition_select', 'value'),
+         dash.dependencies.Input('season_select', 'value'),
+         dash.dependencies.Input('card_totals', 'data')])
+
+else:
+    @app.callback(
+        dash.dependencies.Output('card_number_shoots-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')])
+    def update_league_shots_card(selected_competition, selected_season):
+        totals = shots.totals(selected_competition, selected_season)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Number of Shoots:", className="card-title"),
+                    html.H3(
+                        "{}".format(totals.shots),
+                        className="card-text",
+                    )
+                ]
+            ), color="warning", inverse=True, style={"width": "18rem"}
+        )
+
+
+    @app.callback(
+        dash.dependencies.Output('card_number_goals-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')])
+    def update_league_goals_card(selected_competition, selected_season):
+        totals = shots.totals(selected_competition, selected_season)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Number of Goals:", className="card-title"),
+                    html.H3(
+                        "{}".format(totals.goals),
+                        className="card-text",
+                    )
+                ]
+            ), color="success", inverse=True, style={"width": "18rem", "margin-top": "5px"}
+        )
+
+
+    @app.callback(
+        dash.dependencies.Output('avg_goal_percent-output-container', 'children'),
+        [dash.dependencies.Input('competition_select', 'value')],
+        [dash.dependencies.Input('season_select', 'value')])
+    def update_league_goal_percent_card(selected_competition, selected_season):
+        totals = shots.totals(selected_competition, selected_season)
+
+        return dbc.Card(
+            dbc.CardBody(
+                [
+                    html.H5("Average goal percentage:", className="card-title"),
+                    html.H3(
+                        "{} %".format(totals.goal_percent),
+                        className="card-text",
+                    )
+                ]
+            ), color="primary", inverse=True, style={"width": "18rem", "margin-top": "5px"}
+        )
+
+
+def xg_map_key(selected_competition, selected_season, team_select, player_select, dpi=DEFAULT_DPI):
+    return images.key('shooting_xg', shots.partition_version(selected_competition, selected_season),
+                      selection_key(selected_competition, selected_season, team_select, player_select),
+                      xg_map_title(selected_competition, player_select), dpi)
+
+
+def xg_map_title(selected_competition, player_select):
+    if player_select:
+        return '{}\n{}'.format(player_select, selected_competition[0])
+    elif selected_competition:
+        return '{}'.format(selected_competition[0])
     else:
-        dff = df
-
-    return dbc.Card(
-        dbc.CardBody(
-            [
-                html.H5("Average goal percentage:", className="card-title"),
-                html.H3(
-                    "{} %".format(round((len(dff[dff["Goal"]]) / len(dff)) * 100, 2)),
-                    className="card-text",
-                )
-            ]
-        ), color="primary", inverse=True, style={"width": "18rem", "margin-top": "5px"}
-    )
-
-
-@app.callback(
-    dash.dependencies.Output('shoot_heatmap', 'src'),
-    [dash.dependencies.Input('competition_select', 'value')],
-    [dash.dependencies.Input('season_select', 'value')])
-def update_table(selected_competition, selected_season):
-    if selected_competition:
-        dff = df[df["competition_name"].isin(selected_competition)]
-        if selected_season:
-            dff = dff[dff["season_name"].isin(selected_season)]
-    elif selected_season:
-        dff = df[df["season_name"].isin(selected_season)]
+        return 'XGoal Analysis'
+
+
+def xg_map_png(selected_competition, selected_season, team_select, player_select, dpi=DEFAULT_DPI,
+               render=renderer.render):
+    key = xg_map_key(selected_competition, selected_season, team_select, player_select, dpi)
+    png = images.get(key)
+    metrics.cache_result(png is not None)
+    if png is None:
+        dff = shots.select(selected_competition, selected_season, team_select, player_select,
+                           columns=['X', 'Y', 'my_xg', 'Goal'])
+        try:
+            with metrics.phase('render'):
+                png = render(render_xg_map, dff,
+                             xg_map_title(selected_competition, player_select), dpi)
+        except (RenderBusy, RenderTimeout, RenderCrashed):
+            # keep showing the previous image rather than an error
+            raise PreventUpdate
+        png = images.put(key, png, tags=shots.partitions(selected_competition, selected_season))
+    return png
+
+
+def draw_xg_map(selected_competition, selected_season, team_select, player_select, dpi=DEFAULT_DPI,
+                render=renderer.render):
+    png = xg_map_png(selected_competition, selected_season, team_select, player_select, dpi, render)
+    return image_src('shooting_xg', xg_map_key(selected_competition, selected_season, team_select, player_select, dpi),
+                     [selected_competition, selected_season, team_select, player_select, dpi], png)
+
+
+def heatmap_key(selected_competition, selected_season, dpi=DEFAULT_DPI):
+    return images.key('shoot_heatmap', shots.partition_version(selected_competition, selected_season),
+                      selection_key(selected_competition, selected_season), dpi)
+
+
+def heatmap_png(selected_competition, selected_season, dpi=DEFAULT_DPI, render=renderer.render):
+    key = heatmap_key(selected_competition, selected_season, dpi)
+    png = images.get(key)
+    metrics.cache_result(png is not None)
+    if png is None:
+        counts = shots.heatmaps(selected_competition, selected_season)
+        try:
+            with metrics.phase('render'):
+                png = render(render_heatmap, *counts, dpi)
+        except (RenderBusy, RenderTimeout, RenderCrashed):
+            raise PreventUpdate
+        png = images.put(key, png, tags=shots.partitions(selected_competition, selected_season))
+    return png
+
+
+def draw_heatmap(selected_competition, selected_season, dpi=DEFAULT_DPI, render=renderer.render):
+    png = heatmap_png(selected_competition, selected_season, dpi, render)
+    return image_src('shoot_heatmap', heatmap_key(selected_competition, selected_season, dpi),
+                     [selected_competition, selected_season, dpi], png)
+
+
+IMAGE_KINDS = {'shooting_xg': xg_map_png, 'shoot_heatmap': heatmap_png}
+IMAGE_KEYS = {'shooting_xg': xg_map_key, 'shoot_heatmap': heatmap_key}
+# the dropdown values an image is drawn from, in order, before its dpi
+IMAGE_SELECTIONS = {'shooting_xg': (list, list, str, str), 'shoot_heatmap': (list, list)}
+
+
+def check_selection(kind, selection):
+    """`selection` of an image of `kind` as sent back by a client; ValueError if it is not one image_src makes."""
+    types = IMAGE_SELECTIONS[kind]
+    if not isinstance(selection, list) or len(selection) != len(types) + 1:
+        raise ValueError("a {} selection has {} values".format(kind, len(types) + 1))
+    for value, value_type in zip(selection, types):
+        if value is None:
+            continue
+        if not isinstance(value, value_type) or (value_type is list and not all(isinstance(v, str) for v in value)):
+            raise ValueError("not a dropdown value: {!r}".format(value))
+    # every other dpi would be a template of its own, and a figure of any size
+    if isinstance(selection[-1], bool) or not isinstance(selection[-1], int) or selection[-1] not in DPI_TIERS:
+        raise ValueError("not a dpi tier: {!r}".format(selection[-1]))
+    return selection
+
+
+def image_url(kind, key, selection):
+    return app.get_relative_path('/images/{}/{}?{}'.format(kind, key, urlencode({'selection': json.dumps(selection)})))
+
+
+def image_src(kind, key, selection, png):
+    """URL of the image on the image route, or the PNG inline with IMAGE_ROUTE=0."""
+    if not IMAGE_ROUTE:
+        return to_data_uri(png)
+    return image_url(kind, key, selection)
+
+
+@app.server.route('/images/<kind>/<key>')
+def serve_image(kind, key):
+    if kind not in IMAGE_KINDS:
+        metrics.label(UNKNOWN)
+        flask.abort(404)
+    metrics.label('/images/{}'.format(kind))
+    # the key hashes the selection and the dataset version, so it is a strong validator of the image
+    fmt = best_format(flask.request.headers.get('Accept', ''), IMAGE_FORMATS)
+    etag = '{}-{}-{}-{}'.format(key[:32], fmt, IMAGE_QUALITY, IMAGE_SCALE)
+    if etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
     else:
-        dff = df
-
-    mpl.rcParams.update({'text.color': "white",
-                         'axes.labelcolor': "white"})
-
-    buf = io.BytesIO()
-    pitch = VerticalPitch(pitch_type='statsbomb', line_zorder=2,
-                          pitch_color='#22312b', line_color='#efefef', half=True)
-    # draw
-    fig, ax = pitch.draw(nrows=1, ncols=2, figsize=(10, 6))
-    fig.set_facecolor('#22312b')
-    bin_statistic = pitch.bin_statistic(dff.X, dff.Y, statistic='count', bins=(45, 45))
-    bin_statistic['statistic'] = gaussian_filter(bin_statistic['statistic'], 1)
-    pcm = pitch.heatmap(bin_statistic, ax=ax[0], cmap='hot', edgecolors='#22312b')
-#    cbar = fig.colorbar(pcm, ax=ax[0], shrink=0.3)
-#    cbar.outline.set_edgecolor('#efefef')
-#    cbar.ax.yaxis.set_tick_params(color='#efefef')
-#    plt.setp(plt.getp(cbar.ax.axes, 'yticklabels'), color='#efefef')
-    
-
-    dff = dff[dff['Goal']]
-    bin_statistic = pitch.bin_statistic(dff.X, dff.Y, statistic='count', bins=(45, 45))
-    bin_statistic['statistic'] = gaussian_filter(bin_statistic['statistic'], 1)
-    pcm = pitch.heatmap(bin_statistic, ax=ax[1], cmap='hot', edgecolors='#22312b')
-#    cbar = fig.colorbar(pcm, ax=ax[1], shrink=0.3)
-
-    ax[0].text(x=40, y=80, s='Shoots',
-              size=30,
-              color=pitch.line_color,
-              va='center', ha='center')
-
-    ax[1].text(x=40, y=80, s='Goals',
-              size=30,
-              color=pitch.line_color,
-              va='center', ha='center')
-
-    
-
-    plt.savefig(buf, format="png", bbox_inches='tight')
-
-    plt.close()
-    data = base64.b64encode(buf.getbuffer()).decode("utf8")  # encode to html elements
-    return "data:image/png;base64,{}".format(data)
+        variant = images.key(key, fmt, IMAGE_QUALITY, IMAGE_SCALE)
+        image = images.get(variant)
+        metrics.cache_result(image is not None)
+        if image is None:
+            try:
+                selection = check_selection(kind, json.loads(flask.request.args.get('selection', 'null')))
+            except ValueError:
+                flask.abort(400)
+            # the image is stored under the URL's key, which must be the key of what the selection draws; it
+            # differs too when the URL was made by a process that has seen more or fewer appends than this one
+            current = IMAGE_KEYS[kind](*selection)
+            if current != key:
+                return flask.redirect(image_url(kind, current, selection))
+            png = images.get(key)
+            if png is None:
+                # evicted, or rendered by another worker: the selection in the URL is enough to draw it again
+                try:
+                    png = IMAGE_KINDS[kind](*selection)
+                except PreventUpdate:
+                    flask.abort(503)
+            tags = shots.partitions(*selection[:2])
+            with metrics.phase('encode'):
+                image = transcode(png, fmt, IMAGE_QUALITY, IMAGE_SCALE)
+            image = images.put(variant, image, tags=tags)
+        response = flask.Response(image, mimetype=MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age={}'.format(IMAGE_MAX_AGE)
+    response.vary.add('Accept')
+    return response
+
+
+def viewport_dpi(style, viewport):
+    """DPI tier for the width the image column spans on the client's screen, in device pixels."""
+    if not viewport:
+        # not measured yet, the store is filled right after the page loads
+        raise PreventUpdate
+    # the image columns are lg=4, a third of the page from the lg breakpoint up, the whole width below it
+    width = viewport['width'] / 3 if viewport['width'] >= 992 else viewport['width']
+    return choose_dpi(style, width * viewport.get('ratio', 1))
+
+
+def render_inline(function, *args):
+    # a background job already runs in its own process
+    return function(*args)
+
+
+xg_map_inputs = [dash.dependencies.Input('competition_select', 'value'),
+                 dash.dependencies.Input('season_select', 'value'),
+                 dash.dependencies.Input('team_select', 'value'),
+                 dash.dependencies.Input('player_select', 'value')]
+heatmap_inputs = [dash.dependencies.Input('competition_select', 'value'),
+                  dash.dependencies.Input('season_select', 'value')]
+viewport_input = dash.dependencies.Input('viewport', 'data')
+
+if SHOT_MAP_MODE == 'client':
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction('shot_map', 'figure'),
+        dash.dependencies.Output('shooting_xg_graph', 'figure'),
+        xg_map_inputs + [dash.dependencies.Input('shot_data', 'data'),
+                         dash.dependencies.Input('pitch_layout', 'data')])
+
+elif background_manager is None:
+    @app.callback(dash.dependencies.Output('shooting_xg', 'src'), xg_map_inputs + [viewport_input])
+    def update_shot_map(selected_competition, selected_season, team_select, player_select, viewport):
+        return draw_xg_map(selected_competition, selected_season, team_select, player_select,
+                           viewport_dpi('xg_map', viewport))
+
+else:
+    # a cached image is shown right away, otherwise the bare pitch while a job draws the image;
+    # a job still running when the selection changes again is cancelled
+    @app.callback([dash.dependencies.Output('shooting_xg', 'src'),
+                   dash.dependencies.Output('shooting_xg_job', 'data')], xg_map_inputs + [viewport_input])
+    def update_shot_map(selected_competition, selected_season, team_select, player_select, viewport):
+        selection = [selected_competition, selected_season, team_select, player_select,
+                     viewport_dpi('xg_map', viewport)]
+        key = xg_map_key(*selection)
+        png = images.get(key)
+        if png is not None:
+            return image_src('shooting_xg', key, selection, png), dash.no_update
+        return to_data_uri(*render_placeholder('xg_map')), selection
+
+
+    @app.callback(dash.dependencies.Output('shooting_xg', 'src', allow_duplicate=True),
+                  dash.dependencies.Input('shooting_xg_job', 'data'),
+                  background=True, cancel=xg_map_inputs, prevent_initial_call=True)
+    def finish_shot_map_job(job):
+        try:
+            check_selection('shooting_xg', job)
+        except ValueError:
+            raise PreventUpdate
+        return draw_xg_map(*job, render=render_inline)
+
+if background_manager is None:
+    @app.callback(dash.dependencies.Output('shoot_heatmap', 'src'), heatmap_inputs + [viewport_input])
+    def update_heatmap(selected_competition, selected_season, viewport):
+        return draw_heatmap(selected_competition, selected_season, viewport_dpi('heatmap', viewport))
+
+else:
+    @app.callback([dash.dependencies.Output('shoot_heatmap', 'src'),
+                   dash.dependencies.Output('shoot_heatmap_job', 'data')], heatmap_inputs + [viewport_input])
+    def update_heatmap(selected_competition, selected_season, viewport):
+        selection = [selected_competition, selected_season, viewport_dpi('heatmap', viewport)]
+        key = heatmap_key(*selection)
+        png = images.get(key)
+        if png is not None:
+            return image_src('shoot_heatmap', key, selection, png), dash.no_update
+        return to_data_uri(*render_placeholder('heatmap')), selection
+
+
+    @app.callback(dash.dependencies.Output('shoot_heatmap', 'src', allow_duplicate=True),
+                  dash.dependencies.Input('shoot_heatmap_job', 'data'),
+                  background=True, cancel=heatmap_inputs, prevent_initial_call=True)
+    def finish_heatmap_job(job):
+        try:
+            check_selection('shoot_heatmap', job)
+        except ValueError:
+            raise PreventUpdate
+        return draw_heatmap(*job, render=render_inline)
+
+
+if METRICS:
+    metrics.instrument(app)
+    metrics.gauge('render_pool_refused_total', 'counter', 'Render jobs refused because the pool was busy.',
+                  lambda: renderer.refused)
+    metrics.gauge('render_pool_timed_out_total', 'counter', 'Render jobs that did not finish in time.',
+                  lambda: renderer.timed_out)
+    metrics.gauge('render_pool_crashed_total', 'counter', 'Render jobs whose worker died.',
+                  lambda: renderer.crashed)
+    metrics.gauge('image_cache_bytes', 'gauge', 'Bytes of rendered images held in memory.',
+                  lambda: images.memory.current_bytes)
+
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+        return flask.Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+profiler.instrument(app, outputs=('shooting_xg', 'shoot_heatmap'))
+
+
+def require_admin():
+    if not ADMIN_TOKEN:
+        flask.abort(404)
+    if not hmac.compare_digest(flask.request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        flask.abort(403)
+
+
+@app.server.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """Profiler settings and saved profiles; POST enabled and / or threshold (JSON or form) to change them."""
+    require_admin()
+    if flask.request.method == 'POST':
+        settings = flask.request.get_json(silent=True) or flask.request.form
+        enabled = settings.get('enabled')
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ('1', 'true', 'on', 'yes')
+        try:
+            profiler.configure(enabled=enabled, threshold=settings.get('threshold'))
+        except (TypeError, ValueError):
+            flask.abort(400)
+    return flask.jsonify(profiler.status())
+
+
+@app.server.route('/admin/profiler/<name>')
+def admin_profile(name):
+    require_admin()
+    path = profiler.path(name)
+    if path is None:
+        flask.abort(404)
+    return flask.send_file(path, mimetype='text/plain')
+
+
+if DEBUG_PANEL:
+    @app.callback(dash.dependencies.Output('metrics_panel', 'children'),
+                  dash.dependencies.Input('metrics_interval', 'n_intervals'))
+    def update_debug_panel(n_intervals):
+        rows = metrics.summary()
+        if not rows:
+            return "No callback requests yet."
+        return dbc.Table.from_dataframe(pd.DataFrame(rows), striped=True, bordered=True, hover=True, size='sm')
 
 
 @app.callback(dash.dependencies.Output('page_content', 'children'),
               [dash.dependencies.Input('url', 'pathname')])
 def display_page(pathname):
     if pathname == '/':
-        return container
+        return container()
     if pathname == '/heat_map':
-        return container_2
+        return container_2()
+
+
+def start():
+    """
+    Fork the render workers and start polling for new shots. Call it once in
+    every process that serves requests, before it starts its threads (wsgi.py
+    does it after the server forks its workers).
+    """
+    renderer.start()
+    if watcher is not None:
+        watcher.start()
 
 
 if __name__ == '__main__':
+    start()
     app.run_server(port=3000, debug=True)
@@ -13,7 +13,9 @@ import matplotlib.pyplot as plt
 import io
 import base64
 
-df = pd.read_csv('../my_proj/all_shots_16_20.csv')
+from dataset import load_shots
+
+df = load_shots()
 
 # Fonts
 robotto_regular = FontManager()
@@ -0,0 +1,232 @@
+"""
+Per callback instrumentation of the Dash app.
+
+`CallbackMetrics.instrument(app)` hooks the Flask server: every request to
+the Dash callback route is timed from the moment Flask hands it over until
+its response is built, labelled with the output id it updates, and the size
+of its response (before compression) and its outcome (ok, prevented by
+PreventUpdate, error) are counted. Other views opt in with `label`. Labels
+come from the client, so only outputs of the app's callbacks get their own:
+the rest are counted as UNKNOWN, and anonymous requests cannot add series.
+
+Within a request, `phase` times parts of the work (the filtering, the
+rendering) and `cache_result` counts cache lookups; `timed(obj, phase)`
+wraps an object so every method call on it is a phase. They all report to
+the request being handled on the current thread and do nothing outside of
+one. Everything is kept in counters and fixed bucket histograms updated
+under one lock, a few microseconds per request.
+
+`prometheus()` renders the metrics in the Prometheus text format (served on
+/metrics) and `summary()` as rows for the in-app debug panel.
+"""
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+import flask
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# the label of requests for an output or an image that does not exist
+UNKNOWN = 'unknown'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels.items()) + '}'
+
+
+class _Series:
+    __slots__ = ('outcomes', 'buckets', 'seconds', 'max_seconds', 'phases', 'payload_bytes', 'cache')
+
+    def __init__(self):
+        self.outcomes = {'ok': 0, 'prevented': 0, 'error': 0}
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.phases = {}  # phase -> seconds
+        self.payload_bytes = 0
+        self.cache = {'hit': 0, 'miss': 0}
+
+    @property
+    def count(self):
+        return sum(self.outcomes.values())
+
+
+class _TimedProxy:
+    """`obj` with its method calls timed as `phase`."""
+
+    def __init__(self, metrics, obj, phase):
+        self.__wrapped__ = obj
+        self._metrics = metrics
+        self._phase = phase
+
+    def __getattr__(self, name):
+        value = getattr(self.__wrapped__, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def timed(*args, **kwargs):
+            with self._metrics.phase(self._phase):
+                return value(*args, **kwargs)
+        return timed
+
+
+class CallbackMetrics:
+
+    def __init__(self):
+        self._series = {}  # label -> _Series
+        self._gauges = []  # (name, kind, help, function)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def instrument(self, app):
+        """Time the callback requests of the Dash `app`."""
+        callback_path = app.config.routes_pathname_prefix + '_dash-update-component'
+        server = app.server
+
+        @server.before_request
+        def _start():
+            self._local.request = {'label': None, 'start': time.perf_counter(), 'phases': {}, 'cache': []}
+            if flask.request.path == callback_path:
+                body = flask.request.get_json(silent=True)
+                output = body.get('output') if isinstance(body, dict) else None
+                if not isinstance(output, str) or output not in app.callback_map:
+                    self.label(UNKNOWN)
+                else:
+                    # multi output callbacks are '..a.children...b.children..', the ids are enough
+                    self.label(output.strip('.').replace('...', ' '))
+
+        @server.after_request
+        def _finish(response):
+            self._record(response)
+            return response
+
+        @server.teardown_request
+        def _clear(_):
+            self._local.request = None
+
+        return self
+
+    def label(self, label):
+        """Record the current request under `label`."""
+        request = getattr(self._local, 'request', None)
+        if request is not None:
+            request['label'] = label
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            request['phases'][name] = request['phases'].get(name, 0.0) + time.perf_counter() - start
+
+    def cache_result(self, hit):
+        request = getattr(self._local, 'request', None)
+        if request is not None:
+            request['cache'].append(bool(hit))
+
+    def timed(self, obj, phase):
+        return _TimedProxy(self, obj, phase)
+
+    def gauge(self, name, kind, help, function):
+        """Export `function()` as the `kind` ('gauge' or 'counter') metric `name`."""
+        self._gauges.append((name, kind, help, function))
+
+    def _record(self, response):
+        request = getattr(self._local, 'request', None)
+        if request is None or request['label'] is None:
+            return
+        seconds = time.perf_counter() - request['start']
+        if response.status_code == 204:
+            outcome = 'prevented'
+        elif response.status_code >= 400:
+            outcome = 'error'
+        else:
+            outcome = 'ok'
+        payload = 0 if response.is_streamed else response.calculate_content_length() or 0
+        with self._lock:
+            series = self._series.get(request['label'])
+            if series is None:
+                series = self._series[request['label']] = _Series()
+            series.outcomes[outcome] += 1
+            series.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+            series.seconds += seconds
+            series.max_seconds = max(series.max_seconds, seconds)
+            for name, phase_seconds in request['phases'].items():
+                series.phases[name] = series.phases.get(name, 0.0) + phase_seconds
+            series.payload_bytes += payload
+            for hit in request['cache']:
+                series.cache['hit' if hit else 'miss'] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return {label: (dict(s.outcomes), list(s.buckets), s.seconds, s.max_seconds, dict(s.phases),
+                            s.payload_bytes, dict(s.cache))
+                    for label, s in self._series.items()}
+
+    def prometheus(self):
+        """All the metrics in the Prometheus text exposition format."""
+        snapshot = sorted(self._snapshot().items())
+        lines = ['# HELP dash_callback_requests_total Callback requests by outcome.',
+                 '# TYPE dash_callback_requests_total counter']
+        for output, (outcomes, *_) in snapshot:
+            for outcome, count in outcomes.items():
+                lines.append('dash_callback_requests_total{} {}'.format(_labels(output=output, outcome=outcome), count))
+        lines += ['# HELP dash_callback_duration_seconds Wall time of the callback requests.',
+                  '# TYPE dash_callback_duration_seconds histogram']
+        for output, (outcomes, buckets, seconds, *_) in snapshot:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append('dash_callback_duration_seconds_bucket{} {}'.format(
+                    _labels(output=output, le=bound), cumulative))
+            lines.append('dash_callback_duration_seconds_sum{} {}'.format(_labels(output=output), seconds))
+            lines.append('dash_callback_duration_seconds_count{} {}'.format(_labels(output=output), cumulative))
+        lines += ['# HELP dash_callback_phase_seconds_total Time spent in a phase (filter, render, ...) of the callbacks.',
+                  '# TYPE dash_callback_phase_seconds_total counter']
+        for output, (_, _, _, _, phases, _, _) in snapshot:
+            for phase, seconds in sorted(phases.items()):
+                lines.append('dash_callback_phase_seconds_total{} {}'.format(
+                    _labels(output=output, phase=phase), seconds))
+        lines += ['# HELP dash_callback_response_bytes_total Uncompressed size of the callback responses.',
+                  '# TYPE dash_callback_response_bytes_total counter']
+        for output, (_, _, _, _, _, payload, _) in snapshot:
+            lines.append('dash_callback_response_bytes_total{} {}'.format(_labels(output=output), payload))
+        lines += ['# HELP dash_callback_cache_lookups_total Image cache lookups of the callbacks.',
+                  '# TYPE dash_callback_cache_lookups_total counter']
+        for output, (_, _, _, _, _, _, cache) in snapshot:
+            if sum(cache.values()):
+                for result, count in cache.items():
+                    lines.append('dash_callback_cache_lookups_total{} {}'.format(
+                        _labels(output=output, result=result), count))
+        for name, kind, help, function in self._gauges:
+            lines += ['# HELP {} {}'.format(name, help), '# TYPE {} {}'.format(name, kind),
+                      '{} {}'.format(name, function())]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """One row per callback output: requests, outcomes, mean / max time, phases, payload and cache hits."""
+        rows = []
+        for output, (outcomes, buckets, seconds, max_seconds, phases, payload, cache) in sorted(
+                self._snapshot().items()):
+            count = sum(outcomes.values())
+            lookups = sum(cache.values())
+            rows.append({'output': output, 'requests': count, 'prevented': outcomes['prevented'],
+                         'errors': outcomes['error'],
+                         'mean ms': round(1000 * seconds / count, 1), 'max ms': round(1000 * max_seconds, 1),
+                         'filter ms': round(1000 * phases.get('filter', 0) / count, 1),
+                         'render ms': round(1000 * phases.get('render', 0) / count, 1),
+                         'mean kB': round(payload / count / 1024, 1),
+                         'cache hits': '{:.0%}'.format(cache['hit'] / lookups) if lookups else ''})
+        return rows
@@ -0,0 +1,75 @@
+"""
+Options of the dependent team and player dropdowns.
+
+The competition -> season -> team -> player hierarchy is indexed once: every
+(competition, season) keeps the sorted names of its teams and players, and
+every (competition, season, team) the sorted names of its players. A
+selection spanning several partitions merges their lists, and the merged
+list is memoised per selection, so the options never come from a filter of
+the shot table.
+"""
+import bisect
+import heapq
+import threading
+
+from caching import SizedLRUCache
+from shot_filter import PARTITION_COLUMNS, as_list, covers, selection_key
+
+
+def _merge(lists):
+    # union of sorted lists, still sorted
+    merged = []
+    for name in heapq.merge(*lists):
+        if not merged or merged[-1] != name:
+            merged.append(name)
+    return merged
+
+
+class OptionIndex:
+
+    def __init__(self, df, cache_bytes=4 * 2 ** 20):
+        self._teams = {}  # (competition, season) -> sorted team names
+        self._players = {}  # (competition, season) or (competition, season, team) -> sorted player names
+        self._lock = threading.Lock()
+        self.merged = SizedLRUCache(cache_bytes, sizeof=lambda names: 64 + 8 * len(names))
+        self.add(df)
+
+    @staticmethod
+    def _insert(table, key, names):
+        # a new tuple per update, readers never see a half sorted list
+        current = list(table.get(key, ()))
+        for name in names:
+            i = bisect.bisect_left(current, name)
+            if i == len(current) or current[i] != name:
+                current.insert(i, name)
+        table[key] = tuple(current)
+
+    def add(self, rows):
+        """Index the teams and players of newly loaded shots."""
+        pairs = rows[PARTITION_COLUMNS + ['team_name', 'player_name']].drop_duplicates()
+        touched = set()
+        with self._lock:
+            for (competition, season), group in pairs.groupby(PARTITION_COLUMNS, observed=True):
+                self._insert(self._teams, (competition, season), group['team_name'].unique())
+                self._insert(self._players, (competition, season), group['player_name'].unique())
+                for team, players in group.groupby('team_name', observed=True)['player_name']:
+                    self._insert(self._players, (competition, season, team), players.unique())
+                touched.add((competition, season))
+        self.merged.discard(lambda key: any(covers(key[1][0], key[1][1], c, s) for c, s in touched))
+
+    def _lookup(self, kind, table, competitions, seasons, suffix=()):
+        wanted_competitions, wanted_seasons = set(as_list(competitions)), set(as_list(seasons))
+        keys = [(c, s) + suffix for c, s in list(self._teams) if covers(wanted_competitions, wanted_seasons, c, s)]
+        if len(keys) == 1:
+            return list(table.get(keys[0], ()))
+        return list(self.merged.get_or_compute(
+            (kind, selection_key(competitions, seasons, *suffix)),
+            lambda: tuple(_merge([table[key] for key in keys if key in table]))))
+
+    def teams(self, competitions=None, seasons=None):
+        """Sorted team names of the selected competitions and seasons."""
+        return self._lookup('teams', self._teams, competitions, seasons)
+
+    def players(self, competitions=None, seasons=None, team=None):
+        """Sorted player names of the selected competitions and seasons, of one team if given."""
+        return self._lookup('players', self._players, competitions, seasons, (team,) if team else ())
@@ -0,0 +1,225 @@
+"""
+Stack sampling profiles of slow requests.
+
+`SlowRequestProfiler.instrument(app, outputs)` hooks the Flask server like
+metrics.py does: while it is enabled, every request to the Dash callback
+route updating one of `outputs` (and every request of their images on
+/images/<output>) is sampled. A daemon thread reads the stack of the request
+threads every `interval` seconds with `sys._current_frames`, and the stacks
+are counted in the folded format of flamegraph.pl and speedscope, one
+`frame;frame;... count` line per stack. Requests that took longer than
+`threshold` seconds are written to `directory` as <time>-<output>.folded,
+with a .json next to it holding the selection that was asked for, the
+duration and the number of samples; only the `keep` latest are kept. Faster
+requests are just dropped, and nothing runs while the profiler is disabled.
+
+`configure` switches it on and off and sets the threshold at runtime. The
+settings are written to `directory` as well, so every process of the server
+picks them up within a second, and they hold over restarts until changed
+again.
+
+With RENDER_WORKERS > 0 the drawing runs in the render pool and shows up as
+a wait in `RenderPool.render`; run with RENDER_WORKERS=0 to see inside it.
+"""
+import collections
+import datetime
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import flask
+
+SETTINGS_FILE = 'settings.json'
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_qualname, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+
+    def __init__(self, directory, threshold=2.0, interval=0.005, keep=50, enabled=False):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+        self.enabled = enabled
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sampler = None
+        self._local = threading.local()
+        self._settings_checked = 0.0
+        self._settings_mtime = None
+
+    def instrument(self, app, outputs):
+        """Profile the callback requests of the Dash `app` that update one of `outputs`, and their images."""
+        callback_path = app.config.routes_pathname_prefix + '_dash-update-component'
+        image_paths = tuple('/images/{}/'.format(output) for output in outputs)
+        server = app.server
+
+        @server.before_request
+        def _start():
+            self._refresh()
+            if not self.enabled:
+                return
+            request = flask.request
+            if request.path == callback_path:
+                body = request.get_json(silent=True) or {}
+                output = body.get('output', '')
+                if not any(name in output for name in outputs):
+                    return
+                selection = {i.get('id'): i.get('value') for i in body.get('inputs', []) if isinstance(i, dict)}
+            elif request.path.startswith(image_paths):
+                output = request.path
+                try:
+                    selection = json.loads(request.args.get('selection', 'null'))
+                except ValueError:
+                    # the image route answers it with a 400, it is kept as it came
+                    selection = request.args.get('selection')
+            else:
+                return
+            self._local.request = {'output': output, 'selection': selection, 'start': time.perf_counter()}
+            self._start_sampling()
+
+        @server.after_request
+        def _finish(response):
+            request = getattr(self._local, 'request', None)
+            if request is not None:
+                self._local.request = None
+                seconds = time.perf_counter() - request['start']
+                samples = self._stop_sampling()
+                if seconds >= self.threshold and samples:
+                    self.save(samples, seconds, request['output'], request['selection'])
+            return response
+
+        @server.teardown_request
+        def _clear(_):
+            # a request that failed before after_request
+            if getattr(self._local, 'request', None) is not None:
+                self._local.request = None
+                self._stop_sampling()
+
+        return self
+
+    def _start_sampling(self):
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+            self._wakeup.notify()
+
+    def _stop_sampling(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+                idents = list(self._active)
+            frames = sys._current_frames()
+            stacks = {ident: _folded(frames[ident]) for ident in idents if ident in frames}
+            del frames
+            with self._lock:
+                for ident, stack in stacks.items():
+                    samples = self._active.get(ident)
+                    if samples is not None:
+                        samples[stack] += 1
+            time.sleep(self.interval)
+
+    def save(self, samples, seconds, output, selection):
+        """Write the folded stacks of one request and its metadata; returns the name of the profile."""
+        os.makedirs(self.directory, exist_ok=True)
+        created = datetime.datetime.now(datetime.timezone.utc)
+        name = '{:%Y%m%d-%H%M%S-%f}-{}'.format(created, re.sub(r'[^A-Za-z0-9_]+', '_', output).strip('_')[:64])
+        base = os.path.join(self.directory, name)
+        with open(base + '.folded', 'w') as f:
+            for stack, count in samples.most_common():
+                f.write('{} {}\n'.format(stack, count))
+        with open(base + '.json', 'w') as f:
+            json.dump({'name': name, 'output': output, 'selection': selection, 'seconds': seconds,
+                       'samples': sum(samples.values()), 'interval': self.interval, 'pid': os.getpid(),
+                       'created': created.isoformat()}, f, indent=2)
+        self._prune()
+        return name
+
+    def _prune(self):
+        # the names start with their creation time, the first ones are the oldest
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.folded')))[:-self.keep or None]:
+            for stale in (path, path[:-len('.folded')] + '.json'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def profiles(self):
+        """Metadata of the saved profiles, newest first."""
+        profiles = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json')), reverse=True):
+            if os.path.basename(path) == SETTINGS_FILE:
+                continue
+            try:
+                with open(path) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # pruned or still being written by another process
+                continue
+        return profiles
+
+    def path(self, name):
+        """Path of the folded stacks of the profile `name`, None if there is no such profile."""
+        path = os.path.join(self.directory, name + '.folded')
+        if os.path.basename(path) != name + '.folded' or not os.path.isfile(path):
+            return None
+        return path
+
+    def configure(self, enabled=None, threshold=None):
+        """Switch the profiler on or off and / or change its threshold, in every process of the server."""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = bool(enabled)
+            if threshold is not None:
+                self.threshold = float(threshold)
+            settings = {'enabled': self.enabled, 'threshold': self.threshold}
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, SETTINGS_FILE)
+        with open(path + '.{}.tmp'.format(os.getpid()), 'w') as f:
+            json.dump(settings, f)
+        os.replace(path + '.{}.tmp'.format(os.getpid()), path)
+        self._settings_mtime = os.stat(path).st_mtime_ns
+        return settings
+
+    def _refresh(self):
+        # at most once a second, the settings another process may have written
+        now = time.monotonic()
+        if now - self._settings_checked < 1:
+            return
+        self._settings_checked = now
+        path = os.path.join(self.directory, SETTINGS_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._settings_mtime:
+                return
+            with open(path) as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._settings_mtime = mtime
+        self.enabled = bool(settings.get('enabled', self.enabled))
+        self.threshold = float(settings.get('threshold', self.threshold))
+
+    def status(self):
+        return {'enabled': self.enabled, 'threshold': self.threshold, 'interval': self.interval,
+                'keep': self.keep, 'directory': self.directory, 'profiles': self.profiles()}
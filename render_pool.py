@@ -0,0 +1,130 @@
+"""
+Rendering of the pitch images in worker processes.
+
+Matplotlib drawing holds the GIL, so under a threaded server concurrent image
+requests queue up behind each other. `RenderPool` runs the rendering
+functions of rendering.py in a pool of processes instead. At most
+`max_pending` jobs are queued or running; past that new jobs wait up to
+`queue_timeout` seconds for a slot and are then refused with `RenderBusy`,
+and a job that takes longer than `timeout` raises `RenderTimeout` in the
+caller. A job still running then cannot be cancelled, so the whole pool is
+killed and replaced (the jobs running next to it fail too), and so is a
+pool a worker died in (out of memory, a crash in native code): the job that
+was running raises `RenderCrashed`.
+
+With `workers=0` the jobs run in the calling thread.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class RenderBusy(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class RenderCrashed(Exception):
+    pass
+
+
+def _warm_up():
+    # draw the pitch templates once per worker instead of on its first job
+    import rendering
+    for style in rendering.PITCH_STYLES:
+        rendering.get_template(style)
+
+
+class RenderPool:
+
+    def __init__(self, workers=2, max_pending=8, timeout=30, queue_timeout=5):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.refused = 0
+        self.timed_out = 0
+        self.crashed = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # one executor per process: a pool created before a fork is not usable from the children
+        if self._executor is None or self._pid != os.getpid():
+            with self._executor_lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(self.workers,
+                                                         mp_context=multiprocessing.get_context('fork'),
+                                                         initializer=_warm_up)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def start(self):
+        """
+        Fork all the workers now. Call it before the server starts its threads:
+        forking later, from a threaded process, is best avoided.
+        """
+        if self.workers:
+            executor = self._get_executor()
+            for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+        return self
+
+    def _recycle(self, executor):
+        """Kill the workers of `executor`, and whatever they are running; the next job gets a new pool."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        # no public way to stop a running job before Python 3.14's kill_workers
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, function, args):
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(function, *args)
+        except BrokenProcessPool:
+            # a worker died after the last job ended
+            self._recycle(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(function, *args)
+
+    def render(self, function, *args):
+        """Run `function(*args)` in a worker and return its result."""
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.refused += 1
+            raise RenderBusy("{} render jobs already pending".format(self.max_pending))
+        try:
+            executor, future = self._submit(function, args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot is freed when the job ends, even if the caller stopped waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.timed_out += 1
+            if not future.cancel():
+                # running: it would keep its worker (and the jobs queued behind it) as long as it hangs
+                self._recycle(executor)
+            raise RenderTimeout("render job did not finish within {}s".format(self.timeout))
+        except BrokenProcessPool:
+            self.crashed += 1
+            self._recycle(executor)
+            raise RenderCrashed("a render worker died during the job")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,242 @@
+"""
+Rendering of the dashboard pitch images.
+
+Drawing a mplsoccer pitch (stripes, goal box, every line and arc) costs far
+more than the few hundred shots plotted on top of it, so each pitch style is
+drawn once into a `PitchTemplate`: a raster of the pitch plus the geometry of
+its axes. A request then only builds a blank figure, pastes the raster in and
+draws the shot markers and title text. Templates are kept per style and
+DPI tier, `choose_dpi` picks the tier that covers the width the client
+displays the image at.
+
+Only the object oriented Figure / Agg API is used, never pyplot or global
+rcParams, so figures can be drawn concurrently from threads or in the
+worker processes of render_pool.py.
+"""
+import functools
+import io
+import threading
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mplsoccer import VerticalPitch
+from PIL import Image
+
+# a figure's pixel width is its width in inches times the DPI: the tiers trade sharpness for drawing time
+DEFAULT_DPI = 100
+DPI_TIERS = (50, 75, 100, 150, 200)
+
+
+def _draw_pitch(pitch, figsize, nrows=1, ncols=1, dpi=100):
+    # what pitch.draw() does, without going through pyplot
+    fig = Figure(figsize=figsize, dpi=dpi, layout='tight')
+    FigureCanvasAgg(fig)
+    axs = np.atleast_1d(fig.subplots(nrows, ncols))
+    for ax in axs.flat:
+        pitch.draw(ax=ax)
+    return fig, axs
+
+
+class PitchTemplate:
+
+    def __init__(self, pitch_kwargs, draw_kwargs, facecolor=None, lines_on_top=False, dpi=DEFAULT_DPI):
+        self.pitch = VerticalPitch(**pitch_kwargs)
+        self.line_color = self.pitch.line_color
+
+        fig, axs = _draw_pitch(self.pitch, dpi=dpi, **draw_kwargs)
+        if facecolor:
+            fig.set_facecolor(facecolor)
+        self.facecolor = fig.get_facecolor()
+        self.dpi = fig.dpi
+        self.crop = self._tight_crop(fig)
+        self.background = self._rasterize(fig)
+        # the template figure is the tight crop of the original one, so nothing is trimmed per request
+        x0, y0, x1, y1 = self.crop
+        self.figsize = ((x1 - x0) / self.dpi, (y1 - y0) / self.dpi)
+        width, height = fig.bbox.width, fig.bbox.height
+        self.axes = []
+        for ax in axs.flat:
+            # position after the equal aspect has been applied, so the copies need no aspect of their own
+            left, bottom, w, h = ax.get_position().bounds
+            bounds = ((left * width - x0) / (x1 - x0), (bottom * height - y0) / (y1 - y0),
+                      w * width / (x1 - x0), h * height / (y1 - y0))
+            self.axes.append((bounds, ax.get_xlim(), ax.get_ylim()))
+
+        # lines drawn above the data (line_zorder) are kept as a transparent second layer
+        self.foreground = None
+        if lines_on_top:
+            fig, _ = _draw_pitch(VerticalPitch(**dict(pitch_kwargs, pitch_color='none')), dpi=dpi, **draw_kwargs)
+            fig.patch.set_alpha(0)
+            self.foreground = self._rasterize(fig)
+
+    def _tight_crop(self, fig):
+        # the pixel box bbox_inches='tight' would have kept, clipped to the figure
+        fig.canvas.draw()
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(matplotlib.rcParams['savefig.pad_inches'])
+        x0, y0 = max(int(np.floor(bbox.x0 * self.dpi)), 0), max(int(np.floor(bbox.y0 * self.dpi)), 0)
+        x1 = min(int(np.ceil(bbox.x1 * self.dpi)), int(fig.bbox.width))
+        y1 = min(int(np.ceil(bbox.y1 * self.dpi)), int(fig.bbox.height))
+        return x0, y0, x1, y1
+
+    def _rasterize(self, fig):
+        fig.canvas.draw()
+        pixels = np.asarray(fig.canvas.buffer_rgba())
+        x0, y0, x1, y1 = self.crop
+        height = pixels.shape[0]
+        return pixels[height - y1:height - y0, x0:x1].copy()
+
+    def new_figure(self):
+        """Blank figure with the pitch raster and axes matching the original drawing."""
+        fig = Figure(figsize=self.figsize, dpi=self.dpi, facecolor=self.facecolor)
+        FigureCanvasAgg(fig)
+        fig.figimage(self.background, origin='upper', zorder=-1)
+        if self.foreground is not None:
+            fig.figimage(self.foreground, origin='upper', zorder=1)
+        axs = []
+        for bounds, xlim, ylim in self.axes:
+            ax = fig.add_axes(bounds)
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
+            ax.set_axis_off()
+            axs.append(ax)
+        return fig, axs
+
+    def to_png(self, fig):
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=self.dpi, facecolor=self.facecolor)
+        return buf.getvalue()
+
+    def _flatten(self):
+        # the pitch as one RGB image, foreground lines composited over the background
+        pixels = self.background[..., :3].astype(np.float32)
+        if self.foreground is not None:
+            alpha = self.foreground[..., 3:] / 255
+            pixels = self.foreground[..., :3] * alpha + pixels * (1 - alpha)
+        return pixels.round().astype(np.uint8)
+
+    @staticmethod
+    def _to_jpeg(pixels, quality=60):
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format='jpeg', quality=quality)
+        return buf.getvalue()
+
+    @functools.cached_property
+    def placeholder(self):
+        """JPEG of the bare pitch, a fraction of the PNG's size, shown while the real image is drawn."""
+        return self._to_jpeg(self._flatten())
+
+    def axes_image(self, index=0):
+        """JPEG of the pitch inside one of the axes, with the xlim and ylim it spans."""
+        (left, bottom, width, height), xlim, ylim = self.axes[index]
+        pixels = self._flatten()
+        rows, cols = pixels.shape[:2]
+        top, right = int(round((1 - bottom - height) * rows)), int(round((left + width) * cols))
+        pixels = pixels[top:int(round((1 - bottom) * rows)), int(round(left * cols)):right]
+        return self._to_jpeg(pixels, quality=80), xlim, ylim
+
+
+PITCH_STYLES = {
+    'xg_map': dict(pitch_kwargs=dict(pad_bottom=0.5,  # pitch extends slightly below halfway line
+                                     half=True,  # half of a pitch
+                                     goal_type='box',
+                                     goal_alpha=0.8,
+                                     pitch_color='grass',
+                                     line_color='white',
+                                     stripe=True),
+                   draw_kwargs=dict(figsize=(12, 10))),
+    'heatmap': dict(pitch_kwargs=dict(pitch_type='statsbomb', line_zorder=2,
+                                      pitch_color='#22312b', line_color='#efefef', half=True),
+                    draw_kwargs=dict(nrows=1, ncols=2, figsize=(10, 6)),
+                    facecolor='#22312b',
+                    lines_on_top=True),
+}
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_template(style, dpi=DEFAULT_DPI):
+    # templates are never dropped, one per tier bounds their memory
+    if dpi not in DPI_TIERS:
+        raise ValueError("dpi {!r} is not one of the tiers {}".format(dpi, DPI_TIERS))
+    template = _templates.get((style, dpi))
+    if template is None:
+        with _templates_lock:
+            template = _templates.get((style, dpi))
+            if template is None:
+                template = _templates[style, dpi] = PitchTemplate(dpi=dpi, **PITCH_STYLES[style])
+    return template
+
+
+def choose_dpi(style, pixel_width, tiers=DPI_TIERS):
+    """Lowest DPI tier at which an image of `style` is at least `pixel_width` pixels wide."""
+    inches = PITCH_STYLES[style]['draw_kwargs']['figsize'][0]
+    for dpi in sorted(tiers):
+        if inches * dpi >= pixel_width:
+            return dpi
+    return max(tiers)
+
+
+def render_xg_map(dff, title, dpi=DEFAULT_DPI):
+    template = get_template('xg_map', dpi)
+    pitch = template.pitch
+    fig, (ax,) = template.new_figure()
+
+    dff_goals = dff[dff.Goal == True]
+    dff_non_goals = dff[dff.Goal != True]
+
+    # plot non-goal shots with hatch
+    pitch.scatter(dff_non_goals.X, dff_non_goals.Y,
+                  # size varies between 100 and 1900 (points squared)
+                  s=(dff_non_goals.my_xg * 1900) + 100,
+                  edgecolors='#b94b75',  # give the markers a charcoal border
+                  c='None',  # no facecolor for the markers
+                  hatch='///',  # the all important hatch (triple diagonal lines)
+                  # for other markers types see: https://matplotlib.org/api/markers_api.html
+                  marker='o',
+                  ax=ax)
+
+    # plot goal shots with a football marker
+    # 'edgecolors' sets the color of the pentagons and edges, 'c' sets the color of the hexagons
+    pitch.scatter(dff_goals.X, dff_goals.Y,
+                  s=(dff_goals.my_xg * 1900) + 100,
+                  edgecolors='blue',
+                  linewidths=0.6,
+                  c='white',
+                  marker='football',
+                  ax=ax)
+
+    ax.text(x=40, y=80, s=title,
+            size=30,
+            color=template.line_color,
+            va='center', ha='center')
+
+    return template.to_png(fig)
+
+
+def render_placeholder(style):
+    """(image, mimetype) of the bare pitch of a style."""
+    return get_template(style).placeholder, 'image/jpeg'
+
+
+def style_pitch(style):
+    """The (undrawn) pitch of a style, for binning data in its coordinates."""
+    return VerticalPitch(**PITCH_STYLES[style]['pitch_kwargs'])
+
+
+def render_heatmap(shot_bins, goal_bins, dpi=DEFAULT_DPI):
+    """Heat maps of the smoothed shot and goal bin statistics (see heatmap_bins.py)."""
+    template = get_template('heatmap', dpi)
+    pitch = template.pitch
+    fig, ax = template.new_figure()
+
+    for axis, bin_statistic, label in ((ax[0], shot_bins, 'Shoots'), (ax[1], goal_bins, 'Goals')):
+        pitch.heatmap(bin_statistic, ax=axis, cmap='hot', edgecolors='#22312b')
+        axis.text(x=40, y=80, s=label,
+                  size=30,
+                  color=template.line_color,
+                  va='center', ha='center')
+
+    return template.to_png(fig)
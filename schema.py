@@ -0,0 +1,107 @@
+"""
+Compact in-memory schema of the shot table (all_shots_16_20.csv / data.csv).
+
+Every worker holds its own copy of the table, so the columns are stored with
+the smallest type that fits them: repeated names as categoricals, ids and
+small counters as narrow integers and coordinates / model outputs as
+float32. The `end_location` string ("[x, y, z]") is split into the numeric
+`end_x`, `end_y` and `end_z` columns.
+
+    python schema.py ../my_proj/all_shots_16_20.csv
+"""
+import sys
+
+import pandas as pd
+
+SHOT_SCHEMA = {
+    'minute': 'int16',
+    'match_id': 'int32',
+    'match_date': 'datetime64',
+    'kick_off': 'category',
+    'home_score': 'int8',
+    'away_score': 'int8',
+    'match_week': 'int16',
+    'player_id': 'int32',
+    'player_name': 'category',
+    'X': 'float32',
+    'Y': 'float32',
+    'team_id': 'int32',
+    'team_name': 'category',
+    'competition_id': 'int16',
+    'competition_name': 'category',
+    'season_id': 'int16',
+    'season_name': 'category',
+    'home_team_id': 'int32',
+    'home_team_name': 'category',
+    'away_team_id': 'int32',
+    'away_team_name': 'category',
+    'competition_stage_name': 'category',
+    'stadium_name': 'category',
+    'statsbomb_xg': 'float32',
+    'end_x': 'float32',
+    'end_y': 'float32',
+    'end_z': 'float32',
+    'technique_name': 'category',
+    'outcome_name': 'category',
+    'type_name': 'category',
+    'body_part_name': 'category',
+    'Goal': 'bool',
+    'theta': 'float32',
+    'distance': 'float32',
+    'my_xg': 'float32',
+}
+
+END_LOCATION_COLUMNS = ['end_x', 'end_y', 'end_z']
+# the columns that tell one shot from another: a file dropped twice or grown since is only added its new shots
+SHOT_KEY = ['match_id', 'minute', 'player_id', 'X', 'Y']
+
+
+def split_end_location(end_location):
+    """'[120.0, 42.5, 0.9]' strings to an end_x / end_y / end_z frame, end_z NaN when missing."""
+    parts = end_location.str.strip('[]').str.split(',', expand=True)
+    parts = parts.reindex(columns=range(len(END_LOCATION_COLUMNS)))
+    parts.columns = END_LOCATION_COLUMNS
+    return parts.apply(pd.to_numeric, errors='coerce').astype('float32')
+
+
+def apply_schema(df):
+    """Cast the columns of a freshly read shot table to `SHOT_SCHEMA`."""
+    if 'end_location' in df:
+        position = df.columns.get_loc('end_location')
+        end = split_end_location(df['end_location'])
+        df = df.drop(columns='end_location')
+        for offset, column in enumerate(END_LOCATION_COLUMNS):
+            df.insert(position + offset, column, end[column])
+    for column, dtype in SHOT_SCHEMA.items():
+        if column not in df:
+            continue
+        if dtype.startswith('datetime'):
+            df[column] = pd.to_datetime(df[column])
+        elif dtype.startswith('int') and df[column].isna().any():
+            df[column] = df[column].astype(dtype.capitalize())  # nullable Int16 / Int32
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def memory_usage(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(before, after):
+    """Bytes held by the table before and after `apply_schema`, per column and in total."""
+    before_columns = before.memory_usage(index=False, deep=True)
+    after_columns = after.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({'before': before_columns, 'after': after_columns})
+    report['ratio'] = report['before'] / report['after']
+    total_before, total_after = memory_usage(before), memory_usage(after)
+    return report, total_before, total_after
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        raw = pd.read_csv(path)
+        report, total_before, total_after = memory_report(raw, apply_schema(raw.copy()))
+        print(report.to_string())
+        print("{}: {:.2f} MB -> {:.2f} MB ({:.1f}x)".format(path, total_before / 2 ** 20, total_after / 2 ** 20,
+                                                           total_before / total_after))
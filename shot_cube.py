@@ -0,0 +1,72 @@
+"""
+Pre-aggregated shot, goal and xG totals for the summary cards.
+
+Totals are kept per (competition, season, team, player) cell together with
+the (competition, season), (competition, season, team) and
+(competition, season, player) roll-ups, so the cards of any dropdown
+combination, multi-selections included, are a sum over a handful of
+dictionary entries instead of a filter of the shot table.
+"""
+from collections import namedtuple
+
+from shot_filter import INDEXED_COLUMNS, as_list, covers
+
+
+class Totals(namedtuple('Totals', ['shots', 'goals', 'xg'])):
+    __slots__ = ()
+
+    @property
+    def goal_percent(self):
+        return round((self.goals / self.shots) * 100, 2)
+
+    def __add__(self, other):
+        return Totals(self.shots + other.shots, self.goals + other.goals, self.xg + other.xg)
+
+
+EMPTY = Totals(0, 0, 0.0)
+
+
+class ShotCube:
+
+    def __init__(self, df):
+        self._partitions = {}  # (competition, season)
+        self._teams = {}  # (competition, season, team)
+        self._players = {}  # (competition, season, player)
+        self._cells = {}  # (competition, season, team, player)
+        self.add(df)
+
+    @staticmethod
+    def _bump(table, key, totals):
+        # a new tuple per update, readers never see a half written cell
+        table[key] = table.get(key, EMPTY) + totals
+
+    def add(self, rows):
+        """Fold newly loaded shots into the totals."""
+        cells = rows.groupby(INDEXED_COLUMNS, observed=True).agg(shots=('Goal', 'size'), goals=('Goal', 'sum'),
+                                                                  xg=('my_xg', 'sum'))
+        for (competition, season, team, player), shots, goals, xg in cells.itertuples(name=None):
+            totals = Totals(int(shots), int(goals), float(xg))
+            self._bump(self._cells, (competition, season, team, player), totals)
+            self._bump(self._teams, (competition, season, team), totals)
+            self._bump(self._players, (competition, season, player), totals)
+            self._bump(self._partitions, (competition, season), totals)
+
+    def cells(self):
+        """(competition, season, team, player), Totals pairs of every cell."""
+        return list(self._cells.items())
+
+    def totals(self, competitions=None, seasons=None, team=None, player=None):
+        competitions, seasons = set(as_list(competitions)), set(as_list(seasons))
+        partitions = [(c, s) for c, s in list(self._partitions) if covers(competitions, seasons, c, s)]
+        if team and player:
+            table, keys = self._cells, [(c, s, team, player) for c, s in partitions]
+        elif team:
+            table, keys = self._teams, [(c, s, team) for c, s in partitions]
+        elif player:
+            table, keys = self._players, [(c, s, player) for c, s in partitions]
+        else:
+            table, keys = self._partitions, partitions
+        result = EMPTY
+        for key in keys:
+            result = result + table.get(key, EMPTY)
+        return result
@@ -0,0 +1,240 @@
+"""
+Filtering of the shot table for the dashboard callbacks.
+
+The name columns used by the dropdowns are stored as categoricals and, for
+every category, the sorted row positions where it appears are kept. A
+selection is then answered by merging / intersecting those position arrays
+instead of scanning the whole columns.
+
+Callbacks that fire for the same dropdown change share the resulting
+`ShotView` through a small LRU cache keyed on the normalised selection.
+
+New rows can be appended to a live index (see ingest.py); the positions are
+extended in place and only the cached views the new rows could belong to are
+dropped. Other caches subscribe to appends to update themselves the same way.
+"""
+import hashlib
+import threading
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from caching import SizedLRUCache
+
+# column -> dropdown it is filtered by
+INDEXED_COLUMNS = ['competition_name', 'season_name', 'team_name', 'player_name']
+PARTITION_COLUMNS = ['competition_name', 'season_name']
+
+
+def as_list(value):
+    # dropdowns give a list when multi=True and a single value otherwise
+    if not value:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [v for v in value if v]
+    return [value]
+
+
+def dataset_version(df):
+    """Short hash of the table contents, changes whenever a row does."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+def selection_key(competitions=None, seasons=None, team=None, player=None):
+    """Hashable form of a selection, independent of the order values were picked in."""
+    return (tuple(sorted(set(as_list(competitions)))), tuple(sorted(set(as_list(seasons)))),
+            team or None, player or None)
+
+
+class ShotView:
+    """The rows of one selection plus the aggregates the cards are built from."""
+
+    def __init__(self, df, positions=None):
+        self.df = df
+        self.positions = positions
+
+    @cached_property
+    def shots(self):
+        return len(self.df)
+
+    @cached_property
+    def goals(self):
+        return int(self.df['Goal'].sum())
+
+    @property
+    def goal_percent(self):
+        return round((self.goals / self.shots) * 100, 2)
+
+    @property
+    def nbytes(self):
+        if self.positions is None:
+            return 0  # the whole table, nothing extra is held
+        return int(self.positions.nbytes + self.df.memory_usage(index=True).sum())
+
+
+def covers(competitions, seasons, competition, season):
+    """
+    Whether a selection of `competitions` and `seasons` (as sets or tuples of
+    names, an empty one selecting all) covers the partition (`competition`,
+    `season`). Every aggregate of the table decides what a selection covers
+    with it, so they all agree with the row filter.
+    """
+    return (not competitions or competition in competitions) and (not seasons or season in seasons)
+
+
+def _selection_matches(key, row):
+    competitions, seasons, team, player = key
+    competition, season, row_team, row_player = row
+    return (covers(competitions, seasons, competition, season)
+            and (team is None or team == row_team) and (player is None or player == row_player))
+
+
+class ShotIndex:
+
+    def __init__(self, df, view_cache_bytes=64 * 2 ** 20):
+        # a shallow copy: the other columns stay views on (a memory map of) the loaded table
+        df = df.copy(deep=False)
+        for column in INDEXED_COLUMNS:
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype('category')
+        self.df = df
+        self.version = dataset_version(df)
+        self._base_version = self.version
+        self._positions = {column: self._build_positions(df[column]) for column in INDEXED_COLUMNS}
+        # (competition, season) -> number of appends that touched it
+        self._partitions = dict.fromkeys(self._partition_keys(df), 0)
+        self.views = SizedLRUCache(view_cache_bytes, sizeof=lambda view: view.nbytes)
+        self._listeners = []
+        self._append_lock = threading.Lock()
+
+    @staticmethod
+    def _build_positions(column, offset=0):
+        # a stable argsort of the codes keeps the positions of each category sorted
+        codes = column.cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable') + offset
+        counts = np.bincount(codes[codes >= 0], minlength=len(column.cat.categories))
+        start = np.count_nonzero(codes < 0)  # missing values sort first
+        positions = {}
+        for category, count in zip(column.cat.categories, counts):
+            positions[category] = order[start:start + count]
+            start += count
+        return positions
+
+    @staticmethod
+    def _partition_keys(df):
+        pairs = df[PARTITION_COLUMNS].drop_duplicates()
+        return list(pairs.itertuples(index=False, name=None))
+
+    def partitions(self, competitions=None, seasons=None):
+        """(competition, season) pairs a selection covers."""
+        competitions, seasons = set(as_list(competitions)), set(as_list(seasons))
+        return sorted((c, s) for c, s in self._partitions if covers(competitions, seasons, c, s))
+
+    def partition_version(self, competitions=None, seasons=None):
+        """
+        Version of the data a selection covers. Unlike `version` it only changes
+        when rows are appended to one of the selection's partitions.
+        """
+        covered = [(c, s, self._partitions[c, s]) for c, s in self.partitions(competitions, seasons)]
+        payload = repr((self._base_version, covered)).encode('utf8')
+        return hashlib.sha1(payload).hexdigest()[:16]
+
+    def subscribe(self, listener):
+        """Call `listener(rows, partitions)` after rows are appended."""
+        self._listeners.append(listener)
+
+    def append(self, rows):
+        """
+        Add `rows` to the table, updating the positions of the values they
+        contain, and return the (competition, season) partitions they touched.
+        """
+        if len(rows) == 0:
+            return set()
+        with self._append_lock:
+            df = self.df.copy(deep=False)
+            rows = rows.reindex(columns=df.columns)
+            for column in df.columns:
+                if isinstance(df[column].dtype, pd.CategoricalDtype):
+                    # new categories go last so the codes of the existing rows stay valid
+                    added = pd.Index(rows[column].dropna().unique()).difference(df[column].cat.categories)
+                    if len(added):
+                        df[column] = df[column].cat.add_categories(added)
+                    rows[column] = pd.Categorical(rows[column], dtype=df[column].dtype)
+                else:
+                    rows[column] = rows[column].astype(df[column].dtype)
+            offset = len(df)
+            df = pd.concat([df, rows], ignore_index=True)
+            rows = df.iloc[offset:]
+
+            positions = {}
+            for column in INDEXED_COLUMNS:
+                positions[column] = dict(self._positions[column])
+                for value, added in self._build_positions(rows[column], offset).items():
+                    if len(added):
+                        current = positions[column].get(value)
+                        positions[column][value] = added if current is None else np.concatenate([current, added])
+
+            touched = set(self._partition_keys(rows))
+            partitions = dict(self._partitions)
+            for key in touched:
+                partitions[key] = partitions.get(key, 0) + 1
+
+            # the table first: readers holding the old positions still find their rows in it
+            self.df = df
+            self._positions = positions
+            self._partitions = partitions
+            self.version = hashlib.sha1((self.version + dataset_version(rows)).encode('utf8')).hexdigest()[:16]
+
+            new_selections = set(rows[INDEXED_COLUMNS].drop_duplicates().itertuples(index=False, name=None))
+            self.views.discard(lambda key: any(_selection_matches(key, row) for row in new_selections))
+            for listener in self._listeners:
+                listener(rows, touched)
+        return touched
+
+    def column_positions(self, column, values):
+        """Sorted row positions where `column` takes any of `values`."""
+        index = self._positions[column]
+        parts = [index[v] for v in as_list(values) if v in index]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        if len(parts) == 1:
+            return parts[0]
+        # categories are disjoint, so the union is a plain concatenation
+        return np.sort(np.concatenate(parts))
+
+    def positions(self, competitions=None, seasons=None, team=None, player=None):
+        """
+        Sorted row positions matching the selection, or None when nothing is
+        selected (every row matches).
+        """
+        selection = zip(INDEXED_COLUMNS, (competitions, seasons, team, player))
+        parts = [self.column_positions(column, values) for column, values in selection if as_list(values)]
+        if not parts:
+            return None
+        parts.sort(key=len)
+        result = parts[0]
+        for part in parts[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, part, assume_unique=True)
+        return result
+
+    def select(self, competitions=None, seasons=None, team=None, player=None):
+        """Rows of the shot table matching the selection, in table order."""
+        positions = self.positions(competitions, seasons, team, player)
+        if positions is None:
+            return self.df
+        return self.df.iloc[positions]
+
+    def view(self, competitions=None, seasons=None, team=None, player=None):
+        """Cached `ShotView` of the selection."""
+        key = selection_key(competitions, seasons, team, player)
+        return self.views.get_or_compute(key, lambda: self._make_view(*key))
+
+    def _make_view(self, competitions, seasons, team, player):
+        positions = self.positions(competitions, seasons, team, player)
+        if positions is None:
+            return ShotView(self.df)
+        return ShotView(self.df.iloc[positions], positions)
@@ -0,0 +1,337 @@
+"""
+Synthetic StatsBomb shaped shot tables, for testing the app at scale.
+
+`ShotGenerator` makes up competitions, seasons, teams (with their
+stadiums) and squads, then plays weekly rounds of fixtures (every team of
+every competition and season once per week, as in a league) until the
+requested number of shots is reached; with more matches than a season
+holds the weeks just carry on. The rows have the column layout of
+data.csv / all_shots_16_20.csv and distributions close to it:
+
+- about 12.8 shots per team and match, shared unevenly by the squad;
+- 1% penalties, 7% free kicks and 13% headers;
+- headers from about 10 yards, other shots from about 20;
+- the technique and outcome frequencies of the real table;
+- an end_location consistent with the outcome.
+
+Goals are drawn from an xG model with body part, type and technique effects
+(reported as statsbomb_xg), so the table carries signal for xg_training.py.
+`theta`, `distance` and `my_xg` come from xg_model.py, and the match scores
+are the goals of the match.
+
+Rows are produced, and written, in chunks of `chunk_rows`: to a CSV, or to a
+Feather (Arrow IPC) file already cast to the schema of schema.py. Point
+SHOTS_PATH at the .csv name next to it and load_shots reads the Feather file:
+
+    python shot_generator.py shots.feather --shots 1000000 --competitions 10 --seasons 10
+"""
+import argparse
+import datetime
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from schema import apply_schema
+from xg_model import XGModel, score
+
+# data.csv
+CSV_COLUMNS = ['minute', 'match_id', 'match_date', 'kick_off', 'home_score', 'away_score', 'match_week',
+               'player_id', 'player_name', 'X', 'Y', 'team_id', 'team_name', 'competition_id',
+               'competition_name', 'season_id', 'season_name', 'home_team_id', 'home_team_name',
+               'away_team_id', 'away_team_name', 'competition_stage_name', 'stadium_name', 'statsbomb_xg',
+               'end_location', 'technique_name', 'outcome_name', 'type_name', 'body_part_name', 'Goal',
+               'theta', 'distance', 'my_xg']
+
+COMPETITIONS = ['La Liga', 'Premier League', 'Serie A', 'Bundesliga', 'Ligue 1', 'Eredivisie', 'Primeira Liga',
+                'Süper Lig', 'Jupiler Pro League', 'Scottish Premiership', 'Super League', 'Allsvenskan']
+CITIES = ['Madrid', 'Sevilla', 'Bilbao', 'Valencia', 'Vigo', 'Getafe', 'Girona', 'Leganés', 'Manchester', 'Leeds',
+          'Liverpool', 'Bristol', 'Milano', 'Torino', 'Genova', 'Napoli', 'Roma', 'Bologna', 'München', 'Dortmund',
+          'Bremen', 'Hamburg', 'Köln', 'Stuttgart', 'Lyon', 'Marseille', 'Nantes', 'Lille', 'Rennes', 'Nice',
+          'Eindhoven', 'Rotterdam', 'Utrecht', 'Porto', 'Braga', 'Lisboa', 'Istanbul', 'Izmir', 'Trabzon', 'Brugge',
+          'Gent', 'Liège', 'Glasgow', 'Aberdeen', 'Dundee', 'Athina', 'Patra', 'Göteborg', 'Malmö', 'Uppsala']
+CLUB_NAMES = ['{} FC', 'Real {}', 'Atlético {}', 'Sporting {}', '{} United', '{} City', 'Olympique {}',
+              'Racing {}', 'Dynamo {}', '{} Athletic']
+FIRST_NAMES = ['Lionel', 'Sergio', 'Luis', 'Jordi', 'Marc', 'Iván', 'Gerard', 'Samuel', 'Antoine', 'Ousmane',
+               'Philippe', 'Arturo', 'Nélson', 'Jean-Clair', 'Martin', 'Francisco', 'Carles', 'Álvaro', 'Thomas',
+               'Harry', 'Mohamed', 'Kevin', 'Raheem', 'Bruno', 'João', 'Ciro', 'Paulo', 'Robert', 'Marco', 'Kylian',
+               'Virgil', 'Frenkie', 'Matthijs', 'Sadio', 'Riyad', 'Karim', 'Romelu', 'Erling', 'Jan', 'Hakim']
+LAST_NAMES = ['García', 'Fernández', 'González', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez',
+              'Martín', 'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Moreno', 'Muñoz', 'Álvarez', 'Romero', 'Alonso',
+              'Navarro', 'Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rossi', 'Russo', 'Ferrari',
+              'Esposito', 'Bianchi', 'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Dubois', 'Lefebvre', 'Moreau',
+              'de Jong', 'Jansen']
+KICK_OFFS = {'20:45:00.000': 36, '16:15:00.000': 18, '21:00:00.000': 10, '18:30:00.000': 7, '22:00:00.000': 6,
+             '13:00:00.000': 4, '16:00:00.000': 4, '20:00:00.000': 4, '19:30:00.000': 3, '18:15:00.000': 2,
+             '21:30:00.000': 2, '17:00:00.000': 2}
+BODY_PARTS = {'Right Foot': 0.45, 'Left Foot': 0.425, 'Head': 0.122, 'Other': 0.003}
+FOOT_TECHNIQUES = {'Normal': 0.805, 'Half Volley': 0.105, 'Volley': 0.064, 'Lob': 0.016, 'Overhead Kick': 0.007,
+                   'Backheel': 0.003}
+HEAD_TECHNIQUES = {'Normal': 0.968, 'Diving Header': 0.032}
+MISSED_OUTCOMES = {'Off T': 1073, 'Saved': 958, 'Blocked': 834, 'Wayward': 127, 'Post': 101, 'Saved Off Target': 11,
+                   'Saved to Post': 3}
+PENALTY_SHARE = 0.01
+FREE_KICK_SHARE = 0.074
+SHOTS_PER_TEAM_MATCH = 12.8
+
+# the model the goals are drawn from, the xG of the generated table
+TRUE_MODEL = XGModel(intercept=-0.76, theta=1.63, distance=-0.114, levels={
+    'body_part_name': {'Head': -1.85, 'Left Foot': 0.13, 'Other': -0.37},
+    'type_name': {'Free Kick': 1.12, 'Penalty': 2.79},
+    'technique_name': {'Backheel': -0.89, 'Diving Header': -0.85, 'Half Volley': -0.53, 'Lob': 1.21,
+                       'Overhead Kick': -0.2, 'Volley': -0.36}})
+
+
+def _names(count, patterns, fallback):
+    names = list(itertools.islice(patterns, count))
+    return names + [fallback.format(i) for i in range(len(names), count)]
+
+
+def _choice(rng, weights, size):
+    """Index into `weights` (a dict, in its order) of `size` draws."""
+    p = np.array(list(weights.values()), dtype=np.float64)
+    return rng.choice(len(p), size=size, p=p / p.sum())
+
+
+def _format_locations(x, y, z=None):
+    x, y = np.round(x, 1), np.round(y, 1)
+    if z is None:
+        return ['[{}, {}]'.format(a, b) for a, b in zip(x.tolist(), y.tolist())]
+    z = np.round(z, 1)
+    return ['[{}, {}, {}]'.format(a, b, c) for a, b, c in zip(x.tolist(), y.tolist(), z.tolist())]
+
+
+class ShotGenerator:
+
+    def __init__(self, competitions=10, seasons=10, teams=20, players=25, last_season=2019, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.teams = teams - teams % 2  # an even number, every team plays every week
+        self.players = players
+        self.competitions = _names(competitions, iter(COMPETITIONS), 'League {}')
+        self.seasons = ['{}/{}'.format(year, year + 1) for year in range(last_season - seasons + 1, last_season + 1)]
+        clubs = (pattern.format(city) for pattern in CLUB_NAMES for city in self.rng.permutation(CITIES))
+        self.team_names = _names(competitions * self.teams, clubs, 'Club {}')
+        self.stadiums = ['Estadio {}'.format(name) for name in self.team_names]
+        # first name and surname, then first name and two surnames once those run out
+        people = itertools.chain(
+            self.rng.permutation(['{} {}'.format(*name) for name in itertools.product(FIRST_NAMES, LAST_NAMES)]),
+            ('{} {} {}'.format(*name) for name in itertools.product(FIRST_NAMES, LAST_NAMES, LAST_NAMES)
+             if name[1] != name[2]))
+        self.player_names = _names(len(self.team_names) * players, people, 'Player {}')
+        # a few players take most of a team's shots
+        share = self.rng.gamma(0.8, size=players)
+        self.shot_share = share / share.sum()
+        self._next_match_id = 3_000_000
+        self._week = 0
+
+    @property
+    def vocabulary(self):
+        """Every value the categorical columns can take, the same for every chunk."""
+        return {
+            'kick_off': list(KICK_OFFS),
+            'player_name': self.player_names,
+            'team_name': self.team_names,
+            'home_team_name': self.team_names,
+            'away_team_name': self.team_names,
+            'competition_name': self.competitions,
+            'season_name': self.seasons,
+            'competition_stage_name': ['Regular Season'],
+            'stadium_name': self.stadiums,
+            'technique_name': sorted(set(FOOT_TECHNIQUES) | set(HEAD_TECHNIQUES)),
+            'outcome_name': sorted(set(MISSED_OUTCOMES) | {'Goal'}),
+            'type_name': ['Free Kick', 'Open Play', 'Penalty'],
+            'body_part_name': list(BODY_PARTS),
+        }
+
+    def _round(self):
+        """The fixtures of one week of every competition and season, as match level arrays."""
+        rng = self.rng
+        competitions, seasons = len(self.competitions), len(self.seasons)
+        per_partition = self.teams // 2
+        partitions = competitions * seasons
+        pairs = np.stack([rng.permutation(self.teams).reshape(per_partition, 2) for _ in range(partitions)])
+        competition = np.repeat(np.arange(competitions), seasons * per_partition)
+        season = np.tile(np.repeat(np.arange(seasons), per_partition), competitions)
+        first_year = np.array([int(name[:4]) for name in self.seasons])[season]
+        start = np.array([np.datetime64('{}-08-15'.format(year)) for year in first_year])
+        dates = start + np.timedelta64(7, 'D') * self._week + rng.integers(0, 3, len(start)).astype('timedelta64[D]')
+        self._week += 1
+        count = len(competition)
+        match_ids = np.arange(self._next_match_id, self._next_match_id + count)
+        self._next_match_id += count
+        return {'match_id': match_ids,
+                'competition': competition,
+                'season': season,
+                'home': competition * self.teams + pairs[..., 0].ravel(),
+                'away': competition * self.teams + pairs[..., 1].ravel(),
+                'week': np.full(count, self._week),
+                'date': dates,
+                'kick_off': _choice(rng, KICK_OFFS, count)}
+
+    def _shots(self, matches):
+        """The shots of `matches`, in the column layout of data.csv."""
+        rng = self.rng
+        per_side = rng.poisson(SHOTS_PER_TEAM_MATCH, size=(len(matches['match_id']), 2))
+        match = np.repeat(np.arange(len(per_side)), per_side.sum(axis=1))
+        home_side = np.concatenate([np.repeat([True, False], counts) for counts in per_side])
+        n = len(match)
+        team = np.where(home_side, matches['home'][match], matches['away'][match])
+        player = team * self.players + rng.choice(self.players, size=n, p=self.shot_share)
+
+        kind = rng.random(n)
+        shot_type = np.where(kind < PENALTY_SHARE, 'Penalty', np.where(kind < PENALTY_SHARE + FREE_KICK_SHARE,
+                                                                       'Free Kick', 'Open Play'))
+        body_part = np.array(list(BODY_PARTS))[_choice(rng, BODY_PARTS, n)]
+        # set pieces are struck with the foot
+        body_part = np.where((shot_type != 'Open Play') & (body_part == 'Head'), 'Right Foot', body_part)
+        body_part = np.where((shot_type != 'Open Play') & (body_part == 'Other'), 'Left Foot', body_part)
+        header = body_part == 'Head'
+        technique = np.where(header, np.array(list(HEAD_TECHNIQUES))[_choice(rng, HEAD_TECHNIQUES, n)],
+                             np.array(list(FOOT_TECHNIQUES))[_choice(rng, FOOT_TECHNIQUES, n)])
+        technique = np.where(shot_type == 'Open Play', technique, 'Normal')
+
+        # distance to the middle of the goal and the angle off the goal's axis
+        distance = np.where(header | (body_part == 'Other'), rng.gamma(11, 0.9, n), rng.gamma(6.1, 3.25, n))
+        distance = np.where(shot_type == 'Free Kick', np.clip(rng.normal(28, 5, n), 18, 40), distance)
+        angle = np.clip(rng.normal(0, 0.6, n), -1.5, 1.5)
+        x = np.clip(120 - distance * np.cos(angle), 40, 119.9)
+        y = np.clip(40 + distance * np.sin(angle), 0.1, 79.9)
+        penalty = shot_type == 'Penalty'
+        x = np.where(penalty, 108 + rng.normal(0, 0.05, n), x)
+        y = np.where(penalty, 40 + rng.normal(0, 0.05, n), y)
+        x, y = np.round(x, 1), np.round(y, 1)
+
+        categories = {'body_part_name': body_part, 'type_name': shot_type, 'technique_name': technique}
+        _, _, true_xg = score(x, y, TRUE_MODEL, categories)
+        goal = rng.random(n) < true_xg
+        outcome = np.where(goal, 'Goal', np.array(list(MISSED_OUTCOMES))[_choice(rng, MISSED_OUTCOMES, n)])
+        theta, distance, xg = score(x, y)
+
+        goals = np.zeros_like(per_side)
+        np.add.at(goals, (match, np.where(home_side, 0, 1)), goal)
+        minute = rng.integers(0, 97, n)
+        order = np.lexsort((minute, match))
+
+        df = pd.DataFrame({
+            'minute': minute,
+            'match_id': matches['match_id'][match],
+            'match_date': np.datetime_as_string(matches['date'][match], unit='D'),
+            'kick_off': np.array(list(KICK_OFFS))[matches['kick_off'][match]],
+            'home_score': goals[match, 0],
+            'away_score': goals[match, 1],
+            'match_week': matches['week'][match],
+            'player_id': player + 1,
+            'player_name': np.array(self.player_names)[player],
+            'X': x,
+            'Y': y,
+            'team_id': team + 1,
+            'team_name': np.array(self.team_names)[team],
+            'competition_id': matches['competition'][match] + 1,
+            'competition_name': np.array(self.competitions)[matches['competition'][match]],
+            'season_id': matches['season'][match] + 1,
+            'season_name': np.array(self.seasons)[matches['season'][match]],
+            'home_team_id': matches['home'][match] + 1,
+            'home_team_name': np.array(self.team_names)[matches['home'][match]],
+            'away_team_id': matches['away'][match] + 1,
+            'away_team_name': np.array(self.team_names)[matches['away'][match]],
+            'competition_stage_name': 'Regular Season',
+            'stadium_name': np.array(self.stadiums)[matches['home'][match]],
+            'statsbomb_xg': true_xg,
+            'end_location': self._end_locations(outcome, x, y),
+            'technique_name': technique,
+            'outcome_name': outcome,
+            'type_name': shot_type,
+            'body_part_name': body_part,
+            'Goal': goal,
+            'theta': theta,
+            'distance': distance,
+            'my_xg': xg,
+        }, columns=CSV_COLUMNS)
+        return df.iloc[order].reset_index(drop=True)
+
+    def _end_locations(self, outcome, x, y):
+        rng = self.rng
+        n = len(outcome)
+        side = np.where(rng.random(n) < 0.5, -1, 1)
+        # on the goal line: in the goal, wide of or over it, on a post
+        line_y = np.select([outcome == 'Goal', outcome == 'Off T', outcome == 'Post'],
+                           [rng.uniform(36.2, 43.8, n), 40 + side * rng.uniform(4.2, 12, n),
+                            40 + side * rng.uniform(3.8, 4.2, n)], rng.uniform(36.5, 43.5, n))
+        line_z = np.where(outcome == 'Off T', rng.uniform(0, 4.5, n), rng.uniform(0, 2.6, n))
+        # saves are made in front of the line, blocks close to the shooter, wayward shots anywhere ahead
+        saved = np.isin(outcome, ['Saved', 'Saved Off Target', 'Saved to Post'])
+        end_x = np.where(saved, rng.uniform(114, 119.5, n), 120.0)
+        blocked_x = x + (120 - x) * rng.uniform(0.05, 0.4, n)
+        blocked_y = np.clip(y + rng.normal(0, 2, n), 0, 80)
+        wayward_x = rng.uniform(x, 120)
+        wayward_y = rng.uniform(0, 80, n)
+        three_d = _format_locations(end_x, line_y, line_z)
+        blocked = _format_locations(blocked_x, blocked_y)
+        wayward = _format_locations(wayward_x, wayward_y)
+        return np.select([outcome == 'Blocked', outcome == 'Wayward'], [blocked, wayward], three_d)
+
+    def chunks(self, shots, chunk_rows=100_000):
+        """Frames of about `chunk_rows` rows, whole matches each, until `shots` shots (or just over)."""
+        pending, buffered, produced = [], 0, 0
+        while produced < shots:
+            rows = self._shots(self._round())
+            if produced + len(rows) > shots:
+                # whole matches only, the last one may take the total a little past `shots`
+                last = rows['match_id'].iloc[shots - produced - 1]
+                rows = rows.iloc[:rows['match_id'].searchsorted(last, side='right')]
+            pending.append(rows)
+            buffered += len(rows)
+            produced += len(rows)
+            if buffered >= chunk_rows or produced >= shots:
+                yield pd.concat(pending, ignore_index=True)
+                pending, buffered = [], 0
+
+    def columnar(self, df):
+        """`df` cast to the schema of schema.py, with the same categories in every chunk."""
+        df = apply_schema(df)
+        for column, values in self.vocabulary.items():
+            df[column] = pd.Categorical(df[column], categories=values)
+        return df
+
+
+def write(path, shots, chunk_rows=100_000, **options):
+    """Generate `shots` shots into `path`, a .csv or a .feather / .arrow file; returns the number of rows."""
+    generator = ShotGenerator(**options)
+    written = 0
+    if path.endswith('.csv'):
+        for i, chunk in enumerate(generator.chunks(shots, chunk_rows)):
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            written += len(chunk)
+        return written
+    import pyarrow as pa
+    writer = None
+    try:
+        for chunk in generator.chunks(shots, chunk_rows):
+            table = pa.Table.from_pandas(generator.columnar(chunk), preserve_index=False)
+            if writer is None:
+                # uncompressed, like dataset.convert, so load_shots can memory map it
+                writer = pa.ipc.new_file(path, table.schema)
+            writer.write_table(table)
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic shot table.')
+    parser.add_argument('path', help='a .csv, or a .feather file cast to the app schema')
+    parser.add_argument('--shots', type=int, default=1_000_000)
+    parser.add_argument('--chunk-rows', type=int, default=100_000)
+    parser.add_argument('--competitions', type=int, default=10)
+    parser.add_argument('--seasons', type=int, default=10)
+    parser.add_argument('--teams', type=int, default=20, help='per competition')
+    parser.add_argument('--players', type=int, default=25, help='per team')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = datetime.datetime.now()
+    count = write(args.path, args.shots, args.chunk_rows, competitions=args.competitions, seasons=args.seasons,
+                  teams=args.teams, players=args.players, seed=args.seed)
+    print('{} shots written to {} in {:.1f}s'.format(count, args.path,
+                                                     (datetime.datetime.now() - start).total_seconds()))
@@ -0,0 +1,81 @@
+"""
+The shot data behind the dashboard callbacks.
+
+main.py asks a shot source for everything it shows: dropdown options, card
+totals, top scorers, the shots of a selection and heat map counts, plus the
+partition versions its image cache keys on. There are two backends:
+
+- `PandasShotSource` holds the table in memory and answers from the indexes
+  and pre-aggregates of shot_filter.py, shot_cube.py, leaderboard.py,
+  option_index.py and heatmap_bins.py.
+- `DuckDBShotSource` (duckdb_source.py) keeps the shots in a DuckDB file and
+  runs every question as SQL, for histories that do not fit in memory.
+"""
+from heatmap_bins import HeatmapBins
+from leaderboard import Leaderboard
+from option_index import OptionIndex
+from schema import SHOT_KEY
+from shot_cube import ShotCube
+from shot_filter import ShotIndex
+
+
+class PandasShotSource:
+
+    def __init__(self, df, pitch, top_k=7):
+        self.index = ShotIndex(df)
+        self.cube = ShotCube(self.index.df)
+        self.leaderboard = Leaderboard(self.index.df, k=top_k)
+        self.options = OptionIndex(self.index.df)
+        self.bins = HeatmapBins(pitch, self.index.df)
+        for part in (self.cube, self.leaderboard, self.options, self.bins):
+            self.index.subscribe(lambda rows, partitions, part=part: part.add(rows))
+
+    @property
+    def version(self):
+        return self.index.version
+
+    def partitions(self, competitions=None, seasons=None):
+        return self.index.partitions(competitions, seasons)
+
+    def partition_version(self, competitions=None, seasons=None):
+        return self.index.partition_version(competitions, seasons)
+
+    def subscribe(self, listener):
+        self.index.subscribe(listener)
+
+    def append(self, rows):
+        return self.index.append(rows)
+
+    def shot_keys(self, match_ids):
+        """The SHOT_KEY columns of the loaded shots of `match_ids`."""
+        df = self.index.df
+        return df.loc[df['match_id'].isin(match_ids), SHOT_KEY]
+
+    def competitions(self):
+        return sorted({competition for competition, _ in self.index.partitions()})
+
+    def seasons(self):
+        return sorted({season for _, season in self.index.partitions()})
+
+    def teams(self, competitions=None, seasons=None):
+        return self.options.teams(competitions, seasons)
+
+    def players(self, competitions=None, seasons=None, team=None):
+        return self.options.players(competitions, seasons, team)
+
+    def totals(self, competitions=None, seasons=None, team=None, player=None):
+        return self.cube.totals(competitions, seasons, team, player)
+
+    def cells(self):
+        return self.cube.cells()
+
+    def top_scorers(self, competitions=None, seasons=None):
+        return self.leaderboard.table(competitions, seasons)
+
+    def select(self, competitions=None, seasons=None, team=None, player=None, columns=None):
+        """Shots of the selection, in table order."""
+        df = self.index.view(competitions, seasons, team, player).df
+        return df if columns is None else df[columns]
+
+    def heatmaps(self, competitions=None, seasons=None):
+        return self.bins.heatmaps(competitions, seasons)
@@ -0,0 +1,61 @@
+"""
+Production entry point of the dashboard, for gunicorn or uWSGI.
+
+`python main.py` runs the single process development server, with the
+debugger and the reloader. Under a WSGI server the app is imported once in
+the master process instead (gunicorn's preload_app, uWSGI's default) and the
+workers are forked from it: importing this module loads the shot table and
+builds its indexes, draws the pitch templates at every DPI tier and one
+figure of each kind, so matplotlib's font and text layout caches are filled,
+and then freezes the garbage collector so the workers share all of it
+copy-on-write rather than each holding its own copy. A figure that fails to
+draw is logged and does not keep the server from starting: only the caches
+it warms are lost.
+
+The render pool and the shot watcher are started per worker after the
+fork (`post_fork`), a pool or a thread from before the fork is not usable in
+the children. Every worker has its own metrics (metrics.py) and image cache
+in memory; IMAGE_CACHE_DIR shares the rendered images between them.
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+    uwsgi --http :3000 --module wsgi:server --master --processes 4 --threads 4
+"""
+import gc
+import logging
+
+import pandas as pd
+
+import main
+from rendering import DPI_TIERS, PITCH_STYLES, get_template, render_heatmap, render_xg_map
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Draw the pitch templates and one xG map and heat map, without caching any image."""
+    figures = [(get_template, style, dpi) for style in PITCH_STYLES for dpi in DPI_TIERS]
+    figures += [(render_xg_map, pd.DataFrame({'X': [], 'Y': [], 'my_xg': [], 'Goal': []}), 'warm-up'),
+                (render_heatmap, *main.shots.heatmaps())]
+    for function, *args in figures:
+        try:
+            function(*args)
+        except Exception:
+            logger.exception("Could not warm up %s", function.__name__)
+
+
+def post_fork():
+    main.start()
+
+
+warm_up()
+# objects made so far are never freed, and a collection no longer writes to (and so copies) their pages
+gc.freeze()
+
+try:
+    import uwsgidecorators
+except ImportError:
+    pass
+else:
+    uwsgidecorators.postfork(post_fork)
+
+server = main.app.server
@@ -0,0 +1,155 @@
+"""
+Expected goals (xG) of shots, from where they were taken.
+
+The `theta`, `distance` and `my_xg` columns of the shot table come from a
+logistic model on the shot location, in StatsBomb coordinates (a 120 x 80
+pitch, goals 8 wide centred on y = 40): `distance` is the distance to the
+middle of the nearer goal, `theta` the angle the goal mouth subtends from
+the shot and
+
+    my_xg = 1 / (1 + exp(-(intercept + theta_coefficient * theta + distance_coefficient * distance)))
+
+A model can also carry one coefficient per level of categorical columns such
+as body_part_name (fitted by xg_training.py); levels without a coefficient
+count as the reference level. Fitted models are versioned JSON files,
+written by `save_model` and read by `load_model`.
+
+`shot_geometry` and `score` work on whole X / Y arrays in one NumPy pass
+(a few milliseconds for hundreds of thousands of shots), `score_frame` fills
+the three columns of a shot frame and `score_chunks` does it for a stream of
+frames, e.g. a large CSV read in chunks:
+
+    python xg_model.py shots.csv scored.csv [models/]
+"""
+import glob
+import json
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+PITCH_LENGTH = 120
+GOAL_CENTRE = 40
+GOAL_WIDTH = 8
+
+SCORE_COLUMNS = ['theta', 'distance', 'my_xg']
+
+
+def level_effects(labels, coefficients):
+    """Coefficient of every shot's label, 0 for labels without one (and missing labels)."""
+    labels = pd.Categorical(labels)
+    lookup = np.array([coefficients.get(level, 0.0) for level in labels.categories] + [0.0])
+    return lookup[labels.codes]
+
+
+class XGModel(namedtuple('XGModel', ['intercept', 'theta', 'distance', 'levels', 'version'],
+                         defaults=({}, None))):
+    """Coefficients of the logistic model; `levels` maps categorical columns to {level: coefficient}."""
+
+    def logit(self, theta, distance, categories=None):
+        z = self.intercept + self.theta * theta
+        if self.distance:
+            z += self.distance * distance
+        for column, coefficients in self.levels.items():
+            z += level_effects(categories[column], coefficients)
+        return z
+
+
+# the coefficients the my_xg column of all_shots_16_20.csv was scored with
+DEFAULT_MODEL = XGModel(intercept=-3.2010956502801506, theta=2.5971755718607037, distance=0.0)
+
+
+def shot_geometry(x, y):
+    """Goal angle (radians) and distance to the nearer goal of shots at `x`, `y`."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    dx = np.minimum(x, PITCH_LENGTH - x)
+    dy = np.abs(y - GOAL_CENTRE)
+    squared = dx * dx + dy * dy
+    distance = np.sqrt(squared)
+    # angle between the lines to the two posts; arctan2 keeps it in (0, pi) for shots inside the goal mouth width
+    squared -= (GOAL_WIDTH / 2) ** 2
+    theta = np.arctan2(GOAL_WIDTH * dx, squared, out=squared)
+    return theta, distance
+
+
+def score(x, y, model=DEFAULT_MODEL, categories=None):
+    """theta, distance and xG arrays of shots at `x`, `y`; `categories` holds the labels the model's levels need."""
+    theta, distance = shot_geometry(x, y)
+    xg = model.logit(theta, distance, categories)
+    np.negative(xg, out=xg)
+    np.exp(xg, out=xg)
+    xg += 1
+    np.reciprocal(xg, out=xg)
+    return theta, distance, xg
+
+
+def score_frame(df, model=DEFAULT_MODEL, dtype='float32'):
+    """`df` with its theta, distance and my_xg columns (re)computed from X and Y."""
+    categories = {column: df[column] for column in model.levels}
+    theta, distance, xg = score(df['X'].to_numpy(), df['Y'].to_numpy(), model, categories)
+    return df.assign(theta=theta.astype(dtype), distance=distance.astype(dtype), my_xg=xg.astype(dtype))
+
+
+def fill_missing(df, model=DEFAULT_MODEL):
+    """`df` with the shots that have no xG yet (no my_xg column or a NaN in it) scored."""
+    if 'my_xg' not in df:
+        return score_frame(df, model)
+    missing = df['my_xg'].isna().to_numpy()
+    if not missing.any():
+        return df
+    df = df.copy()
+    categories = {column: df[column].to_numpy()[missing] for column in model.levels}
+    theta, distance, xg = score(df['X'].to_numpy()[missing], df['Y'].to_numpy()[missing], model, categories)
+    for column, values in zip(SCORE_COLUMNS, (theta, distance, xg)):
+        if column not in df:
+            df[column] = np.nan
+        df.loc[missing, column] = values.astype(df[column].dtype)
+    return df
+
+
+def score_chunks(chunks, model=DEFAULT_MODEL, dtype='float32'):
+    """Score an iterable of shot frames lazily, one frame at a time."""
+    for chunk in chunks:
+        yield score_frame(chunk, model, dtype)
+
+
+def save_model(model, directory, **info):
+    """Write `model` (and `info`, e.g. its training metrics) to `directory`/xg-<version>.json; returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'xg-{}.json'.format(model.version))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(dict(model._asdict(), **info), f, indent=2)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load_model(path):
+    """The model of a JSON file written by `save_model`, or the latest one of a directory of them."""
+    if os.path.isdir(path):
+        # versions start with their creation time, the last name is the newest model
+        paths = sorted(glob.glob(os.path.join(path, 'xg-*.json')))
+        if not paths:
+            raise FileNotFoundError("no xG model in {}".format(path))
+        path = paths[-1]
+    with open(path) as f:
+        data = json.load(f)
+    return XGModel(**{field: data[field] for field in XGModel._fields if field in data})
+
+
+def rescore_csv(path, out_path, model=DEFAULT_MODEL, chunksize=2 ** 18):
+    """Write the shots of `path` to `out_path` scored with `model`; returns the number of shots."""
+    count = 0
+    # plain floats, the CSV keeps the precision it was written with
+    for i, chunk in enumerate(score_chunks(pd.read_csv(path, chunksize=chunksize), model, dtype='float64')):
+        chunk.to_csv(out_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        count += len(chunk)
+    return count
+
+
+if __name__ == '__main__':
+    # an optional third argument is the model file (or directory) to score with
+    model = load_model(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MODEL
+    print("{} shots scored".format(rescore_csv(sys.argv[1], sys.argv[2], model)))
@@ -0,0 +1,167 @@
+"""
+Fitting the xG model of xg_model.py to the shot table.
+
+The features are the goal angle (`theta`), the `distance` and one indicator
+per level of body_part_name, type_name and technique_name. The most common
+level of each column is the reference and gets no indicator, and so do
+levels seen fewer than `min_count` times. `FeatureCache` builds the design
+matrix and the goal labels once per table content and keeps them as .npy
+files, memory mapped on the next runs. `fit` runs the logistic regression as
+iteratively reweighted least squares: every Newton step accumulates X'WX and
+X'(y - p) over row blocks of the mapped matrix, so memory stays bounded and a
+multi season table fits in well under a second.
+
+The fitted coefficients are written as versioned JSON files (xg-<time>-<hash>.json)
+that the dashboard loads with XG_MODEL:
+
+    python xg_training.py models ../my_proj/all_shots_16_20.csv [more.csv ...]
+"""
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import read_csv
+from shot_filter import dataset_version
+from xg_model import XGModel, fill_missing, save_model
+
+CATEGORICAL_COLUMNS = ['body_part_name', 'type_name', 'technique_name']
+FEATURE_CACHE_DIR = os.environ.get('XG_FEATURE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'xg_features'))
+
+
+def _levels(df, columns, min_count):
+    """{column: levels with an indicator}, the most common level and the rare ones left out."""
+    levels = {}
+    for column in columns:
+        counts = df[column].value_counts()
+        levels[column] = sorted(str(level) for level, count in counts.iloc[1:].items() if count >= min_count)
+    return levels
+
+
+def _feature_names(levels):
+    return ['intercept', 'theta', 'distance'] + ['{}={}'.format(column, level)
+                                                 for column, names in levels.items() for level in names]
+
+
+class FeatureCache:
+
+    def __init__(self, directory=FEATURE_CACHE_DIR):
+        self.directory = directory
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.X.npy', base + '.y.npy', base + '.json'
+
+    def features(self, df, columns=CATEGORICAL_COLUMNS, min_count=10):
+        """(design matrix, goal labels, levels) of `df`, read-only memory maps of the cached arrays."""
+        used = ['X', 'Y', 'theta', 'distance', 'Goal'] + list(columns)
+        spec = json.dumps([list(columns), min_count]).encode('utf8')
+        key = '{}-{}'.format(dataset_version(df[[c for c in used if c in df]]), hashlib.sha1(spec).hexdigest()[:8])
+        matrix_path, labels_path, meta_path = self._paths(key)
+        if not os.path.exists(meta_path):
+            self._build(fill_missing(df), columns, min_count, key)
+        with open(meta_path) as f:
+            levels = json.load(f)['levels']
+        return np.load(matrix_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r'), levels
+
+    def _build(self, df, columns, min_count, key):
+        os.makedirs(self.directory, exist_ok=True)
+        levels = _levels(df, columns, min_count)
+        names = _feature_names(levels)
+        matrix_path, labels_path, meta_path = self._paths(key)
+        # filled column by column straight into the file, the matrix is never held twice in memory
+        matrix = np.lib.format.open_memmap(matrix_path + '.tmp', mode='w+', dtype=np.float64,
+                                           shape=(len(df), len(names)))
+        matrix[:, 0] = 1
+        matrix[:, 1] = df['theta'].to_numpy(dtype=np.float64)
+        matrix[:, 2] = df['distance'].to_numpy(dtype=np.float64)
+        i = 3
+        for column, names_of_column in levels.items():
+            labels = df[column].astype(str).to_numpy()
+            for level in names_of_column:
+                matrix[:, i] = labels == level
+                i += 1
+        matrix.flush()
+        del matrix
+        np.save(labels_path + '.tmp', df['Goal'].to_numpy(dtype=np.uint8))
+        os.replace(matrix_path + '.tmp', matrix_path)
+        os.replace(labels_path + '.tmp.npy', labels_path)
+        with open(meta_path, 'w') as f:
+            json.dump({'levels': levels, 'features': names}, f)
+
+
+def _probability(z):
+    # the logistic function without overflow for large |z|
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+def fit(matrix, labels, ridge=1e-3, tol=1e-8, max_iter=50, block=2 ** 16):
+    """Logistic regression coefficients of `labels` on `matrix` by IRLS; returns (coefficients, iterations)."""
+    rows, features = matrix.shape
+    coefficients = np.zeros(features)
+    # a small ridge keeps X'WX invertible when a level only ever (or never) scores
+    penalty = ridge * np.eye(features)
+    for iteration in range(1, max_iter + 1):
+        hessian = penalty.copy()
+        gradient = -ridge * coefficients
+        for start in range(0, rows, block):
+            x = np.asarray(matrix[start:start + block])
+            y = np.asarray(labels[start:start + block], dtype=np.float64)
+            p = _probability(x @ coefficients)
+            gradient += x.T @ (y - p)
+            hessian += (x * (p * (1 - p))[:, None]).T @ x
+        step = np.linalg.solve(hessian, gradient)
+        coefficients += step
+        if np.abs(step).max() < tol:
+            break
+    return coefficients, iteration
+
+
+def log_loss(matrix, labels, coefficients, block=2 ** 16):
+    total = 0.0
+    for start in range(0, len(labels), block):
+        p = np.clip(_probability(np.asarray(matrix[start:start + block]) @ coefficients), 1e-15, 1 - 1e-15)
+        y = np.asarray(labels[start:start + block])
+        total -= np.where(y, np.log(p), np.log1p(-p)).sum()
+    return total / len(labels)
+
+
+def as_model(coefficients, levels, created=None):
+    """The XGModel of fitted coefficients, versioned by its creation time and the coefficients themselves."""
+    coefficients = [float(c) for c in coefficients]
+    intercept, theta, distance = coefficients[:3]
+    per_level, i = {}, 3
+    for column, names in levels.items():
+        per_level[column] = dict(zip(names, coefficients[i:i + len(names)]))
+        i += len(names)
+    digest = hashlib.sha1(json.dumps([coefficients, levels]).encode('utf8')).hexdigest()[:8]
+    created = created or datetime.datetime.now(datetime.timezone.utc)
+    return XGModel(intercept, theta, distance, per_level, '{:%Y%m%d%H%M%S}-{}'.format(created, digest))
+
+
+def train(df, cache=None, columns=CATEGORICAL_COLUMNS, min_count=10, ridge=1e-3):
+    """Fit the model to the shots of `df`; returns (model, training metrics)."""
+    cache = cache or FeatureCache()
+    start = time.perf_counter()
+    matrix, labels, levels = cache.features(df, columns, min_count)
+    features_seconds = time.perf_counter() - start
+    coefficients, iterations = fit(matrix, labels, ridge=ridge)
+    fit_seconds = time.perf_counter() - start - features_seconds
+    model = as_model(coefficients, levels)
+    metrics = {'shots': int(len(labels)), 'goals': int(labels.sum()), 'iterations': iterations,
+               'log_loss': float(log_loss(matrix, labels, coefficients)),
+               'features_seconds': round(features_seconds, 4), 'fit_seconds': round(fit_seconds, 4)}
+    return model, metrics
+
+
+if __name__ == '__main__':
+    shots = pd.concat([read_csv(path) for path in sys.argv[2:]], ignore_index=True)
+    model, metrics = train(shots)
+    print(save_model(model, sys.argv[1], trained_on=sys.argv[2:], metrics=metrics))
+    print(json.dumps(metrics))